@@ -27,7 +27,9 @@ type Action =
   | "download_model"
   | "get_cached_models"
   | "get_available_models"
-  | "fetch_raw_responses";
+  | "fetch_raw_responses"
+  | "precompute_embeddings"
+  | "get_cache_stats";
 
 export interface ClusterNamePayload {
   clusterId: UUID;
@@ -64,6 +66,14 @@ export interface ProgressMessage {
   timestamp: number;
 }
 
+export interface EmbeddingProgressMessage {
+  step: ClusteringStep | Action;
+  completed: number;
+  total: number;
+  texts_per_second: number;
+  timestamp: number;
+}
+
 export interface ClusteringProgressMessage {
   step: ClusteringStep;
   status: "todo" | "start" | "complete" | "error";
@@ -201,6 +211,26 @@ export interface RawResonsesMessage {
   responses: string[];
 }
 
+export interface ModelCacheStats {
+  model_name: string;
+  entries: number;
+  dim: number | null;
+  dtype: string | null;
+  hits: number;
+  misses: number;
+  bytes_read: number;
+  bytes_written: number;
+  load_seconds: number;
+  evictions: number;
+  hit_rate: number;
+}
+
+export interface CacheStatsMessage {
+  models: ModelCacheStats[];
+  memory_entries: number;
+  memory_bytes: number;
+}
+
 export interface Message {
   type:
     | "progress"
@@ -217,9 +247,12 @@ export interface Message {
     | "download_status"
     | "cached_models"
     | "available_models"
-    | "raw_responses";
+    | "raw_responses"
+    | "embedding_progress"
+    | "cache_stats";
   data:
     | ProgressMessage
+    | EmbeddingProgressMessage
     | Error
     | string
     | null
@@ -234,7 +267,8 @@ export interface Message {
     | DownloadStatusMessage
     | CachedModelsMessage
     | AvailableModelsMessage
-    | RawResonsesMessage;
+    | RawResonsesMessage
+    | CacheStatsMessage;
 }
 
 export interface FileSettings {
@@ -259,6 +293,8 @@ export type ClusterCount = AutomaticClusterCount | ManualClusterCount;
 export interface OutlierDetectionSettings {
   nearest_neighbors: number;
   z_score_threshold: number;
+  neighbor_search?: "exact" | "approximate";
+  nprobe?: number;
 }
 
 export interface AgglomerativeClusteringSettings {
@@ -273,7 +309,14 @@ export interface KSelectionMetric {
 
 export interface AdvancedSettings {
   embedding_model?: string;
-  kmeans_method: "spherical_kmeans" | "kmeans";
+  kmeans_method: "spherical_kmeans" | "minibatch_spherical_kmeans" | "kmeans";
+  embedding_batch_size?: number;
+  embedding_max_seq_length?: number;
+  embedding_workers?: number;
+  pipelined_embedding?: boolean;
+  kselection_workers?: number;
+  kselection_sweep?: "independent" | "warm_start";
+  kselection_search?: "exhaustive" | "coarse_to_fine" | "golden_section";
   kselection_metrics: KSelectionMetric[];
 }
 
@@ -398,6 +441,7 @@ export interface Timesteps {
   id: UUID;
   total_duration: number;
   steps: Record<ClusteringStep, number>;
+  cache_stats?: Record<string, number> | null;
 }
 
 export interface KSelectionStatistic {
@@ -407,6 +451,7 @@ export interface KSelectionStatistic {
   davies_bouldin: number | null;
   calinski_harabasz: number | null;
   combined: number | null;
+  evaluated: boolean;
 
   clustering_result_id: UUID;
   clustering_result: ClusteringResult;
@@ -670,6 +715,7 @@ export const PYTHON_SERVICE_EVENTS = {
     DOWNLOAD_STATUS: "model:download-status",
     CACHED_MODELS: "model:cached-models",
     AVAILABLE_MODELS: "model:available-models",
+    CACHE_STATS: "model:cache-stats",
   },
 };
 
@@ -51,6 +51,10 @@ export function registerIpcHandlers(
       action: "set_file_settings",
       data: settings,
     });
+    // Fill the embedding cache while the algorithm settings are being chosen
+    pythonService.sendCommand({
+      action: "precompute_embeddings",
+    });
   });
 
   ipcMain.on(
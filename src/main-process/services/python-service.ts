@@ -20,6 +20,8 @@ import {
   DownloadStatusMessage,
   CachedModelsMessage,
   RawResonsesMessage,
+  EmbeddingProgressMessage,
+  CacheStatsMessage,
 } from "../../lib/models";
 import { SettingsService } from "./settings-service";
 import { spawn, ChildProcess } from "child_process";
@@ -198,6 +200,19 @@ export class PythonService extends EventEmitter {
           message.data as RawResonsesMessage,
         );
         break;
+      case "embedding_progress": {
+        const progress = message.data as EmbeddingProgressMessage;
+        consoleLog(
+          `Embedded ${progress.completed}/${progress.total} texts (${progress.texts_per_second.toFixed(1)} texts/s)`,
+        );
+        break;
+      }
+      case "cache_stats":
+        this.emit(
+          PYTHON_SERVICE_EVENTS.MODELS.CACHE_STATS,
+          message.data as CacheStatsMessage,
+        );
+        break;
       default:
         consoleLog("Unknown message type:", message.type);
         this.emit(PYTHON_SERVICE_EVENTS.ERROR, "Unknown message type");
@@ -213,6 +228,7 @@ export class PythonService extends EventEmitter {
       case "set_file_settings":
       case "set_algorithm_settings":
       case "run_clustering":
+      case "precompute_embeddings":
         break;
 
       // Clustering steps
@@ -54,6 +54,21 @@ import { toast } from "sonner";
 import { Separator } from "../../components/ui/separator";
 import { Checkbox } from "../../components/ui/checkbox";
 import { Slider } from "../../components/ui/slider";
+import {
+  DropdownMenu,
+  DropdownMenuContent,
+  DropdownMenuRadioGroup,
+  DropdownMenuRadioItem,
+  DropdownMenuTrigger,
+} from "../../components/ui/dropdown-menu";
+
+type KSelectionSearch = NonNullable<AdvancedSettings["kselection_search"]>;
+
+const kselectionSearchLabels: Record<KSelectionSearch, string> = {
+  exhaustive: "Every Cluster Count",
+  coarse_to_fine: "Coarse to Fine",
+  golden_section: "Golden Section",
+};
 
 export default function AlgorithmSettings() {
   const [autoChooseClusters, setAutoChooseClusters] = useState(true);
@@ -64,6 +79,8 @@ export default function AlgorithmSettings() {
   const [useOutlierDetection, setUseOutlierDetection] = useState(false);
   const [nearestNeighbors, setNearestNeighbors] = useState<number | null>(null);
   const [zScoreThreshold, setZScoreThreshold] = useState<number | null>(null);
+  const [useApproximateSearch, setUseApproximateSearch] = useState(false);
+  const [nprobe, setNprobe] = useState<number | null>(null);
   const [useAgglomerativeClustering, setUseAgglomerativeClustering] =
     useState(false);
   const [similarityThreshold, setSimilarityThreshold] = useState<number | null>(
@@ -127,6 +144,10 @@ export default function AlgorithmSettings() {
         if (settings.outlier_detection) {
           setNearestNeighbors(settings.outlier_detection.nearest_neighbors);
           setZScoreThreshold(settings.outlier_detection.z_score_threshold);
+          setUseApproximateSearch(
+            settings.outlier_detection.neighbor_search === "approximate",
+          );
+          setNprobe(settings.outlier_detection.nprobe ?? null);
         }
         setUseAgglomerativeClustering(
           settings.agglomerative_clustering !== null,
@@ -185,6 +206,9 @@ export default function AlgorithmSettings() {
       ) {
         return false;
       }
+      if (useApproximateSearch && nprobe !== null && !(nprobe >= 1)) {
+        return false;
+      }
     }
 
     if (useAgglomerativeClustering) {
@@ -223,6 +247,8 @@ export default function AlgorithmSettings() {
     useOutlierDetection,
     nearestNeighbors,
     zScoreThreshold,
+    useApproximateSearch,
+    nprobe,
     useAgglomerativeClustering,
     similarityThreshold,
     advancedSettings,
@@ -245,6 +271,8 @@ export default function AlgorithmSettings() {
         ? {
             nearest_neighbors: nearestNeighbors,
             z_score_threshold: zScoreThreshold,
+            neighbor_search: useApproximateSearch ? "approximate" : "exact",
+            nprobe: useApproximateSearch ? nprobe : null,
           }
         : null,
       agglomerative_clustering: useAgglomerativeClustering
@@ -520,6 +548,8 @@ export default function AlgorithmSettings() {
                       if (!isOn) {
                         setNearestNeighbors(null);
                         setZScoreThreshold(null);
+                        setUseApproximateSearch(false);
+                        setNprobe(null);
                       }
                     }}
                   />
@@ -575,6 +605,52 @@ export default function AlgorithmSettings() {
                       placeholder="2.5"
                     />
                   </div>
+                  <div
+                    className={cn(
+                      "flex items-center justify-between",
+                      !useOutlierDetection && "text-gray-400",
+                    )}
+                  >
+                    <p>Approximate Neighbor Search</p>
+                    <Switch
+                      checked={useOutlierDetection && useApproximateSearch}
+                      onCheckedChange={(isOn) => {
+                        setUseApproximateSearch(isOn);
+                        if (!isOn) {
+                          setNprobe(null);
+                        }
+                      }}
+                      disabled={!useOutlierDetection}
+                    />
+                  </div>
+                  <div
+                    className={cn(
+                      "flex items-center justify-between",
+                      !(useOutlierDetection && useApproximateSearch) &&
+                        "text-gray-400",
+                    )}
+                  >
+                    <p>Groups Searched per Response</p>
+                    <Input
+                      type="number"
+                      min={1}
+                      step={1}
+                      value={nprobe || ""}
+                      onChange={(e) =>
+                        setNprobe(e.target.valueAsNumber || null)
+                      }
+                      className={cn(
+                        "w-24",
+                        useOutlierDetection &&
+                          useApproximateSearch &&
+                          nprobe !== null &&
+                          nprobe < 1 &&
+                          "border-rose-500 focus-visible:ring-rose-500 focus-visible:ring-offset-1 dark:border-rose-500 dark:focus-visible:ring-rose-500",
+                      )}
+                      disabled={!(useOutlierDetection && useApproximateSearch)}
+                      placeholder="auto"
+                    />
+                  </div>
                 </div>
               </div>
             </TooltipTrigger>
@@ -649,6 +725,23 @@ export default function AlgorithmSettings() {
                     </p>
                   </div>
                 </div>
+                <div className="flex flex-col gap-2">
+                  <p>
+                    The approximate neighbor search speeds up outlier detection
+                    on large data sets (10,000 or more unique responses) by
+                    only comparing each response with the responses of the
+                    most similar groups. Smaller data sets are always searched
+                    exactly.
+                  </p>
+                  <div className="flex flex-col gap-2 pl-2 text-sm">
+                    <p>
+                      Searching more groups per response is slower, but finds
+                      the same neighbors as the exact search more often. Leave
+                      it empty to search about the square root of the number of
+                      groups.
+                    </p>
+                  </div>
+                </div>
               </div>
             </TooltipContent>
           </Tooltip>
@@ -904,7 +997,31 @@ function AdvancedSettingsDialog({
   const [modelComboboxValue, setModelComboboxValue] = useState("");
   const [cachedModels, setCachedModels] = useState<CachedModel[]>([]);
   const [useSphericalKMeans, setUseSphericalKMeans] = useState(
-    advancedSettings.kmeans_method === "spherical_kmeans",
+    advancedSettings.kmeans_method !== "kmeans",
+  );
+  const [useMiniBatchKMeans, setUseMiniBatchKMeans] = useState(
+    advancedSettings.kmeans_method === "minibatch_spherical_kmeans",
+  );
+  const [useWarmStartSweep, setUseWarmStartSweep] = useState(
+    advancedSettings.kselection_sweep === "warm_start",
+  );
+  const [kselectionSearch, setKselectionSearch] = useState<KSelectionSearch>(
+    advancedSettings.kselection_search || "exhaustive",
+  );
+  const [kselectionWorkers, setKselectionWorkers] = useState<number | null>(
+    advancedSettings.kselection_workers ?? null,
+  );
+  const [embeddingBatchSize, setEmbeddingBatchSize] = useState<number | null>(
+    advancedSettings.embedding_batch_size ?? null,
+  );
+  const [embeddingMaxSeqLength, setEmbeddingMaxSeqLength] = useState<
+    number | null
+  >(advancedSettings.embedding_max_seq_length ?? null);
+  const [embeddingWorkers, setEmbeddingWorkers] = useState<number | null>(
+    advancedSettings.embedding_workers ?? null,
+  );
+  const [usePipelinedEmbedding, setUsePipelinedEmbedding] = useState(
+    advancedSettings.pipelined_embedding ?? false,
   );
   const [useSilhouette, setUseSilhouette] = useState(true);
   const [useCalinski, setUseCalinski] = useState(true);
@@ -1022,14 +1139,48 @@ function AdvancedSettingsDialog({
     if (modelComboboxValue === "") {
       return false;
     }
+
+    if (embeddingBatchSize !== null && embeddingBatchSize < 1) {
+      return false;
+    }
+
+    if (embeddingMaxSeqLength !== null && embeddingMaxSeqLength < 1) {
+      return false;
+    }
+
+    if (embeddingWorkers !== null && embeddingWorkers < 1) {
+      return false;
+    }
+
+    if (kselectionWorkers !== null && kselectionWorkers < 1) {
+      return false;
+    }
     return true;
-  }, [modelComboboxValue, totalWeight]);
+  }, [
+    modelComboboxValue,
+    totalWeight,
+    embeddingBatchSize,
+    embeddingMaxSeqLength,
+    embeddingWorkers,
+    kselectionWorkers,
+  ]);
 
   const handleSave = () => {
     setAdvancedSettings({
       ...advancedSettings,
       embedding_model: modelComboboxValue,
-      kmeans_method: useSphericalKMeans ? "spherical_kmeans" : "kmeans",
+      embedding_batch_size: embeddingBatchSize ?? undefined,
+      embedding_max_seq_length: embeddingMaxSeqLength ?? undefined,
+      embedding_workers: embeddingWorkers ?? undefined,
+      pipelined_embedding: usePipelinedEmbedding,
+      kmeans_method: !useSphericalKMeans
+        ? "kmeans"
+        : useMiniBatchKMeans
+          ? "minibatch_spherical_kmeans"
+          : "spherical_kmeans",
+      kselection_sweep: useWarmStartSweep ? "warm_start" : "independent",
+      kselection_search: kselectionSearch,
+      kselection_workers: kselectionWorkers ?? undefined,
       kselection_metrics: kselectionMetrics,
     });
   };
@@ -1224,6 +1375,105 @@ function AdvancedSettingsDialog({
               Leave empty to use the default model.
             </p>
           </div>
+          <div className="flex flex-col gap-2">
+            <div className="flex items-center justify-between">
+              <label htmlFor="embeddingBatchSize">Embedding Batch Size</label>
+              <Input
+                id="embeddingBatchSize"
+                type="number"
+                min={1}
+                step={1}
+                value={embeddingBatchSize || ""}
+                onChange={(e) =>
+                  setEmbeddingBatchSize(e.target.valueAsNumber || null)
+                }
+                className={cn(
+                  "w-24",
+                  embeddingBatchSize !== null &&
+                    embeddingBatchSize < 1 &&
+                    "border-rose-500 focus-visible:ring-rose-500 focus-visible:ring-offset-1 dark:border-rose-500 dark:focus-visible:ring-rose-500",
+                )}
+                placeholder="32"
+              />
+            </div>
+            <p className="text-sm text-gray-500">
+              Number of responses embedded at once. Larger batches are faster
+              but need more memory.
+            </p>
+          </div>
+          <div className="flex flex-col gap-2">
+            <div className="flex items-center justify-between">
+              <label htmlFor="embeddingMaxSeqLength">
+                Maximum Response Length
+              </label>
+              <Input
+                id="embeddingMaxSeqLength"
+                type="number"
+                min={1}
+                step={1}
+                value={embeddingMaxSeqLength || ""}
+                onChange={(e) =>
+                  setEmbeddingMaxSeqLength(e.target.valueAsNumber || null)
+                }
+                className={cn(
+                  "w-24",
+                  embeddingMaxSeqLength !== null &&
+                    embeddingMaxSeqLength < 1 &&
+                    "border-rose-500 focus-visible:ring-rose-500 focus-visible:ring-offset-1 dark:border-rose-500 dark:focus-visible:ring-rose-500",
+                )}
+                placeholder="model"
+              />
+            </div>
+            <p className="text-sm text-gray-500">
+              Number of tokens of each response the model reads. Longer
+              responses are cut off, which speeds up embedding. Leave empty to
+              use the limit of the model.
+            </p>
+          </div>
+          <div className="flex flex-col gap-2">
+            <div className="flex items-center justify-between">
+              <label htmlFor="embeddingWorkers">Embedding Processes</label>
+              <Input
+                id="embeddingWorkers"
+                type="number"
+                min={1}
+                step={1}
+                value={embeddingWorkers || ""}
+                onChange={(e) =>
+                  setEmbeddingWorkers(e.target.valueAsNumber || null)
+                }
+                className={cn(
+                  "w-24",
+                  embeddingWorkers !== null &&
+                    embeddingWorkers < 1 &&
+                    "border-rose-500 focus-visible:ring-rose-500 focus-visible:ring-offset-1 dark:border-rose-500 dark:focus-visible:ring-rose-500",
+                )}
+                placeholder="1"
+              />
+            </div>
+            <p className="text-sm text-gray-500">
+              Number of processes that embed responses on the CPU. Each process
+              loads its own copy of the model, so more processes need more
+              memory. Has no effect when a GPU is available.
+            </p>
+          </div>
+          <div className="flex flex-col gap-2">
+            <div className="flex items-center justify-between">
+              <label htmlFor="pipelinedEmbedding">
+                Embed While Reading Responses
+              </label>
+              <Switch
+                id="pipelinedEmbedding"
+                checked={usePipelinedEmbedding}
+                onCheckedChange={(isOn) => setUsePipelinedEmbedding(isOn)}
+              />
+            </div>
+            <p className="text-sm text-gray-500">
+              Load the model and embed the first responses while the rest of
+              the file is still being read, instead of one step after the
+              other. Speeds up large files.
+            </p>
+          </div>
           <Separator orientation="horizontal" />
           <div className="flex flex-col gap-2">
             <div className="flex items-center justify-between">
@@ -1238,6 +1488,120 @@ function AdvancedSettingsDialog({
               Use spherical K-Means instead of traditional K-Means Clustering.
             </p>
           </div>
+          <div className="flex flex-col gap-2">
+            <div
+              className={cn(
+                "flex items-center justify-between",
+                !useSphericalKMeans && "text-gray-400",
+              )}
+            >
+              <label htmlFor="miniBatchKMeans">Use Mini-Batch Updates</label>
+              <Switch
+                id="miniBatchKMeans"
+                checked={useSphericalKMeans && useMiniBatchKMeans}
+                onCheckedChange={(isOn) => setUseMiniBatchKMeans(isOn)}
+                disabled={!useSphericalKMeans}
+              />
+            </div>
+            <p className="text-sm text-gray-500">
+              Update the spherical K-Means centers from small random batches of
+              responses. Much faster on large data sets, at a slightly lower
+              clustering quality.
+            </p>
+          </div>
+          <Separator orientation="horizontal" />
+          <div className="flex flex-col gap-2">
+            <div className="flex items-center justify-between">
+              <label htmlFor="warmStartSweep">
+                Warm Start the Cluster Count Search
+              </label>
+              <Switch
+                id="warmStartSweep"
+                checked={useWarmStartSweep}
+                onCheckedChange={(isOn) => setUseWarmStartSweep(isOn)}
+              />
+            </div>
+            <p className="text-sm text-gray-500">
+              Start each cluster count from the clusters of the previous one
+              with its worst cluster split in two, instead of fitting every
+              count from scratch. Runs on a single core, and the chosen number
+              of clusters may differ from the default search.
+            </p>
+          </div>
+          <div className="flex flex-col gap-2">
+            <div className="flex items-center justify-between">
+              <label htmlFor="kselectionSearch">Cluster Count Search</label>
+              <DropdownMenu>
+                <DropdownMenuTrigger asChild>
+                  <Button
+                    variant="outline"
+                    id="kselectionSearch"
+                    className="w-[200px] justify-between"
+                  >
+                    {kselectionSearchLabels[kselectionSearch]}
+                    <ChevronsUpDown className="ml-2 h-4 w-4 shrink-0 opacity-50" />
+                  </Button>
+                </DropdownMenuTrigger>
+                <DropdownMenuContent className="w-[200px]">
+                  <DropdownMenuRadioGroup
+                    value={kselectionSearch}
+                    onValueChange={(value) =>
+                      setKselectionSearch(value as KSelectionSearch)
+                    }
+                  >
+                    {Object.entries(kselectionSearchLabels).map(
+                      ([value, label]) => (
+                        <DropdownMenuRadioItem key={value} value={value}>
+                          {label}
+                        </DropdownMenuRadioItem>
+                      ),
+                    )}
+                  </DropdownMenuRadioGroup>
+                </DropdownMenuContent>
+              </DropdownMenu>
+            </div>
+            <p className="text-sm text-gray-500">
+              Evaluate every cluster count in the range, or search for the best
+              one with fewer fits. Coarse to fine refines a grid of cluster
+              counts around the best one. Golden section assumes a single best
+              count and narrows the range around it. Both may miss the best
+              count on irregular scores.
+            </p>
+          </div>
+          <div className="flex flex-col gap-2">
+            <div
+              className={cn(
+                "flex items-center justify-between",
+                useWarmStartSweep && "text-gray-400",
+              )}
+            >
+              <label htmlFor="kselectionWorkers">
+                Cluster Count Search Processes
+              </label>
+              <Input
+                id="kselectionWorkers"
+                type="number"
+                min={1}
+                step={1}
+                value={kselectionWorkers || ""}
+                onChange={(e) =>
+                  setKselectionWorkers(e.target.valueAsNumber || null)
+                }
+                className={cn(
+                  "w-24",
+                  kselectionWorkers !== null &&
+                    kselectionWorkers < 1 &&
+                    "border-rose-500 focus-visible:ring-rose-500 focus-visible:ring-offset-1 dark:border-rose-500 dark:focus-visible:ring-rose-500",
+                )}
+                disabled={useWarmStartSweep}
+                placeholder="1"
+              />
+            </div>
+            <p className="text-sm text-gray-500">
+              Number of processes that evaluate cluster counts in parallel. Not
+              used by the warm start search.
+            </p>
+          </div>
           <Separator orientation="horizontal" />
           <div className="flex flex-col gap-2">
             <div className="flex flex-col gap-1">
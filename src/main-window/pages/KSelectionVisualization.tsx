@@ -68,9 +68,12 @@ export default function KSelectionVisualization() {
 
   useEffect(() => {
     if (stats.length > 0) {
-      const optimal = stats.reduce((prev, current) =>
-        prev.combined > current.combined ? prev : current,
-      );
+      // Skipped k values have no scores
+      const optimal = stats
+        .filter((s) => s.evaluated !== false)
+        .reduce((prev, current) =>
+          prev.combined > current.combined ? prev : current,
+        );
       setOptimalK(optimal.k);
     }
   }, [stats]);
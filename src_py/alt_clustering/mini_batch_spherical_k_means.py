@@ -0,0 +1,298 @@
+from sklearn.base import BaseEstimator, ClusterMixin
+from sklearn.utils import check_random_state, check_array
+import numpy as np
+
+# partial_fit only sees batches, so it checks for empty centers once this many
+# rows per center have been seen since the last check instead of after a pass
+PARTIAL_FIT_CHECK_ROWS_PER_CENTER = 100
+
+
+class MiniBatchSphericalKMeans(BaseEstimator, ClusterMixin):
+    """
+    Mini-batch Spherical K-Means with sample_weight support and scikit-learn
+    compatibility.
+
+    Every step draws a batch of rows with probability proportional to their
+    sample_weight, so a response that occurs many times is seen as often as
+    its count asks for, and moves the centers towards the weighted mean of
+    their batch members with a per-center learning rate of one over the
+    weight the center has absorbed so far. Fitting stops when an
+    exponentially weighted average of the batch inertia has not improved for
+    `max_no_improvement` steps, or after `max_iter` passes over the data.
+    Centers that absorbed no weight during a pass are reseeded with rows
+    drawn by weight. `partial_fit` does not know the size of a pass and
+    checks after PARTIAL_FIT_CHECK_ROWS_PER_CENTER rows per center instead.
+    """
+
+    def __init__(
+        self,
+        n_clusters,
+        init="k-means++",
+        max_iter=100,
+        batch_size=1024,
+        random_state=None,
+        max_no_improvement=10,
+        init_size=None,
+        chunk_size=8192,
+    ):
+        self.n_clusters = n_clusters
+        self.init = init
+        self.max_iter = max_iter  # Maximum passes over the data
+        self.batch_size = batch_size
+        self.random_state = random_state
+        self.max_no_improvement = max_no_improvement
+        self.init_size = init_size  # Rows sampled for k-means++, 3 batches by default
+        self.chunk_size = chunk_size  # Rows per block of the final assignment
+
+    def _check_weights(self, X, sample_weight):
+        N = X.shape[0]
+        if sample_weight is None:
+            return np.ones(N)
+        sample_weight = check_array(sample_weight, ensure_2d=False)
+        if sample_weight.shape != (N,):
+            raise ValueError("sample_weight must be of shape (n_samples,).")
+        if np.any(sample_weight < 0):
+            raise ValueError("sample_weight must be non-negative.")
+        return sample_weight
+
+    def _init_centers(self, X, sample_weight, rng):
+        N, n = X.shape
+        if isinstance(self.init, np.ndarray):
+            # Explicit initial centers, e.g. to warm start from a previous fit
+            if self.init.shape != (self.n_clusters, n):
+                raise ValueError(
+                    f"init must be of shape (n_clusters, n_features) = ({self.n_clusters}, {n})."
+                )
+            init = np.asarray(self.init, dtype=float)
+            return init / np.linalg.norm(init, axis=1, keepdims=True)
+        if self.init != "k-means++":
+            raise ValueError(f"Unsupported initialization: {self.init}")
+
+        # k-means++ on a weighted sample, seeding on all rows is O(N * k^2)
+        init_size = self.init_size or 3 * max(self.batch_size, self.n_clusters)
+        if init_size < N:
+            sample = rng.choice(N, init_size, p=sample_weight / sample_weight.sum())
+            X, sample_weight = X[sample], np.ones(init_size)
+        centers = np.zeros((self.n_clusters, n))
+        prob = sample_weight / sample_weight.sum()
+        centers[0] = X[rng.choice(len(X), p=prob)]
+        d_min = np.clip(1 - X @ centers[0], 0, None)
+        for k in range(1, self.n_clusters):
+            prob = d_min * sample_weight
+            prob_sum = prob.sum()
+            if prob_sum <= 0:
+                prob = sample_weight.copy()
+                prob_sum = prob.sum()
+            centers[k] = X[rng.choice(len(X), p=prob / prob_sum)]
+            d_min = np.minimum(d_min, np.clip(1 - X @ centers[k], 0, None))
+        return centers
+
+    def _step(self, X, sample_weight):
+        """One streaming update of the centers, returns the weighted batch inertia"""
+        S = X @ self.cluster_centers_.T
+        labels = np.argmax(S, axis=1)
+        max_sim = S[np.arange(len(X)), labels]
+
+        # Weighted sum of the batch members of every center
+        batch_counts = np.bincount(
+            labels, weights=sample_weight, minlength=self.n_clusters
+        )
+        one_hot = np.zeros((len(X), self.n_clusters))
+        one_hot[np.arange(len(X)), labels] = sample_weight
+        batch_sums = one_hot.T @ X
+
+        # Running weighted mean, the old center counts with the weight seen so far
+        updated = batch_counts > 0
+        self.counts_[updated] += batch_counts[updated]
+        self.cluster_centers_[updated] += (
+            batch_sums[updated]
+            - batch_counts[updated, None] * self.cluster_centers_[updated]
+        ) / self.counts_[updated, None]
+        self.cluster_centers_[updated] /= np.linalg.norm(
+            self.cluster_centers_[updated], axis=1, keepdims=True
+        )
+        return np.sum((1 - max_sim) * sample_weight)
+
+    def _reseed_empty(self, X, cumulative_weight, empty, rng):
+        """Move the centers in `empty` to rows drawn by weight and restart their counts"""
+        rows = np.searchsorted(
+            cumulative_weight,
+            rng.uniform(0, cumulative_weight[-1], int(empty.sum())),
+            side="right",
+        )
+        self.cluster_centers_[empty] = X[rows]
+        self.counts_[empty] = 0
+
+    def partial_fit(self, X, y=None, sample_weight=None):
+        """Update the centers with one batch, initializing them on the first call"""
+        X = check_array(X, accept_sparse=False)
+        sample_weight = self._check_weights(X, sample_weight)
+        X = X / np.linalg.norm(X, axis=1, keepdims=True)
+
+        if not hasattr(self, "cluster_centers_"):
+            if self.n_clusters > X.shape[0]:
+                raise ValueError(
+                    f"n_clusters={self.n_clusters} > n_samples={X.shape[0]}."
+                )
+            self._rng = check_random_state(self.random_state)
+            self.cluster_centers_ = self._init_centers(X, sample_weight, self._rng)
+            self.counts_ = np.zeros(self.n_clusters)
+            self.n_steps_ = 0
+            self.n_features_in_ = X.shape[1]
+            # Counts at the last check for empty centers and rows seen since
+            self.epoch_counts_ = self.counts_.copy()
+            self.epoch_rows_ = 0
+
+        self._step(X, sample_weight)
+        self.epoch_rows_ += len(X)
+        if self.epoch_rows_ >= PARTIAL_FIT_CHECK_ROWS_PER_CENTER * self.n_clusters:
+            # Centers that stayed empty since the last check get rows of the batch
+            empty = self.counts_ == self.epoch_counts_
+            if empty.any() and sample_weight.sum() > 0:
+                self._reseed_empty(X, np.cumsum(sample_weight), empty, self._rng)
+            self.epoch_counts_ = self.counts_.copy()
+            self.epoch_rows_ = 0
+        self.n_steps_ += 1
+        self.labels_, self.inertia_ = self._assign(X, sample_weight)
+        return self
+
+    def fit(self, X, y=None, sample_weight=None):
+        # Input validation
+        X = check_array(X, accept_sparse=False)
+        N, n = X.shape
+        sample_weight = self._check_weights(X, sample_weight)
+
+        if self.n_clusters > N:
+            raise ValueError(f"n_clusters={self.n_clusters} > n_samples={N}.")
+
+        # Normalize input vectors to unit length
+        X = X / np.linalg.norm(X, axis=1, keepdims=True)
+
+        # Initialize random state
+        rng = check_random_state(self.random_state)
+        self.n_features_in_ = n
+
+        # Handle trivial case
+        if self.n_clusters <= 1:
+            self.labels_ = np.zeros(N, dtype=int)
+            self.cluster_centers_ = np.mean(X, axis=0, keepdims=True)
+            self.cluster_centers_ /= np.linalg.norm(
+                self.cluster_centers_, axis=1, keepdims=True
+            )
+            self.inertia_ = np.sum(
+                (1 - X @ self.cluster_centers_[0]) * sample_weight
+            )
+            self.n_iter_, self.n_steps_ = 0, 0
+            return self
+
+        self.cluster_centers_ = self._init_centers(X, sample_weight, rng)
+        self.counts_ = np.zeros(self.n_clusters)
+
+        # Batches are drawn by weight and count every drawn row once
+        batch_size = min(self.batch_size, N)
+        steps_per_epoch = max(N // batch_size, 1)
+        # Sampled through the cumulative weights, rng.choice(p=...) rebuilds them every call
+        cumulative_weight = np.cumsum(sample_weight)
+        ewa_inertia, ewa_inertia_min, no_improvement = None, None, 0
+        alpha = min(batch_size * 2.0 / (N + 1), 1.0)
+        step = 0
+        epoch_counts = self.counts_.copy()
+        for step in range(self.max_iter * steps_per_epoch):
+            batch = np.searchsorted(
+                cumulative_weight,
+                rng.uniform(0, cumulative_weight[-1], batch_size),
+                side="right",
+            )
+            batch_inertia = self._step(X[batch], np.ones(batch_size)) / batch_size
+            if (step + 1) % steps_per_epoch == 0:
+                # Empty centers are reseeded once they missed a whole pass
+                empty = self.counts_ == epoch_counts
+                if empty.any():
+                    self._reseed_empty(X, cumulative_weight, empty, rng)
+                epoch_counts = self.counts_.copy()
+
+            # Check convergence on the smoothed batch inertia
+            if ewa_inertia is None:
+                ewa_inertia = batch_inertia
+            else:
+                ewa_inertia = ewa_inertia * (1 - alpha) + batch_inertia * alpha
+            if ewa_inertia_min is None or ewa_inertia < ewa_inertia_min:
+                ewa_inertia_min, no_improvement = ewa_inertia, 0
+            else:
+                no_improvement += 1
+            if no_improvement >= self.max_no_improvement:
+                break
+
+        self.n_steps_ = step + 1
+        self.n_iter_ = int(np.ceil(self.n_steps_ / steps_per_epoch))
+        self.labels_, self.inertia_ = self._assign(X, sample_weight)
+        return self
+
+    def _assign(self, X, sample_weight):
+        """Labels and weighted inertia of all rows, in chunks"""
+        labels = np.empty(len(X), dtype=int)
+        inertia = 0.0
+        for start in range(0, len(X), self.chunk_size):
+            S = X[start : start + self.chunk_size] @ self.cluster_centers_.T
+            labels[start : start + self.chunk_size] = np.argmax(S, axis=1)
+            inertia += np.sum(
+                (1 - S.max(axis=1)) * sample_weight[start : start + self.chunk_size]
+            )
+        return labels, inertia
+
+    def predict(self, X):
+        X = check_array(X, accept_sparse=False)
+        X = X / np.linalg.norm(X, axis=1, keepdims=True)
+        return self._assign(X, np.ones(len(X)))[0]
+
+
+if __name__ == "__main__":
+    # Benchmark: fit time and agreement with the full-batch version on
+    # clustered unit vectors with skewed response counts. Run from src_py with
+    # `python -m alt_clustering.mini_batch_spherical_k_means`
+    import time
+
+    from sklearn.metrics import adjusted_rand_score
+
+    from alt_clustering.spherical_k_means import SphericalKMeans
+
+    rng = np.random.default_rng(0)
+    for N, k in [(10_000, 20), (50_000, 50), (200_000, 100)]:
+        centers = rng.normal(size=(k, 384))
+        X = centers[rng.integers(0, k, N)] + 1.5 * rng.normal(size=(N, 384))
+        X /= np.linalg.norm(X, axis=1, keepdims=True)
+        counts = rng.zipf(2.0, N).clip(max=100).astype(float)
+
+        results, inertias = {}, {}
+        for name, model in [
+            ("full batch", SphericalKMeans(n_clusters=k, random_state=0)),
+            ("mini-batch", MiniBatchSphericalKMeans(n_clusters=k, random_state=0)),
+        ]:
+            start = time.time()
+            model.fit(X, sample_weight=counts)
+            elapsed = time.time() - start
+            # Inertia of the final centers, computed the same way for both
+            inertia = np.sum((1 - (X @ model.cluster_centers_.T).max(axis=1)) * counts)
+            results[name], inertias[name] = model.labels_, inertia
+            print(
+                f"N={N} k={k} {name}: {elapsed:.2f}s, {model.n_iter_} iterations, inertia {inertia:.1f}"
+            )
+        ari = adjusted_rand_score(results["full batch"], results["mini-batch"])
+        print(f"N={N} k={k} adjusted rand index: {ari:.3f}")
+
+        # Streaming the rows in small batches should end close to fit
+        model = MiniBatchSphericalKMeans(n_clusters=k, random_state=0)
+        start = time.time()
+        batch_rng = np.random.default_rng(0)
+        for _ in range(3):
+            order = batch_rng.permutation(N)
+            for batch_start in range(0, N, 256):
+                batch = order[batch_start : batch_start + 256]
+                model.partial_fit(X[batch], sample_weight=counts[batch])
+        elapsed = time.time() - start
+        inertia = np.sum((1 - (X @ model.cluster_centers_.T).max(axis=1)) * counts)
+        ratio = inertia / inertias["mini-batch"]
+        print(
+            f"N={N} k={k} partial_fit: {elapsed:.2f}s, inertia {inertia:.1f}, {ratio:.3f}x fit"
+            + ("" if ratio < 1.1 else " (more than 10% above fit)")
+        )
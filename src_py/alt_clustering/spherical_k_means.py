@@ -58,7 +58,16 @@ class SphericalKMeans(BaseEstimator, ClusterMixin):
         self.cluster_centers_ = np.zeros((self.n_clusters, n))
 
         # Initialization methods with sample_weight integration
-        if self.init == "k-means++":
+        if isinstance(self.init, np.ndarray):
+            # Explicit initial centers, e.g. to warm start from a previous fit
+            if self.init.shape != (self.n_clusters, n):
+                raise ValueError(
+                    f"init must be of shape (n_clusters, n_features) = ({self.n_clusters}, {n})."
+                )
+            init = np.asarray(self.init, dtype=float)
+            self.cluster_centers_ = init / np.linalg.norm(init, axis=1, keepdims=True)
+
+        elif self.init == "k-means++":
             # First center: weighted by sample_weight
             prob = sample_weight / sample_weight.sum()
             i = rng.choice(N, p=prob)
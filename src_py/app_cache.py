@@ -1,26 +1,671 @@
 import os
 import json
 import pickle
+import shutil
 import hashlib
 import time
-from typing import Dict, List, Optional, Any, Mapping
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Any, Mapping
 import numpy as np
 from loguru import logger
-from utils.utils import get_user_data_path
+from utils.utils import get_env_int, get_user_data_path
+
+CACHE_FORMAT_VERSION = 4
+INDEX_FILE_NAME = "index.npz"
+ACCESS_FILE_NAME = "access.npy"
+SHARD_DIR_NAME = "shards"
+# Cache keys are the first 8 bytes of the md5 digest of a text
+HASH_DTYPE = np.dtype("<u8")
+ROW_DTYPE = np.dtype("<u4")
+VECTOR_DTYPE = np.dtype("<f4")
+ACCESS_DTYPE = np.dtype("<f8")
+SCALE_DTYPE = np.dtype("<f4")
+# Formats the matrix can be stored in, int8 rows come with a float32 scale each
+STORAGE_DTYPES = {
+    "float32": np.dtype("<f4"),
+    "float16": np.dtype("<f2"),
+    "int8": np.dtype("i1"),
+}
+VECTOR_FILE_NAMES = {
+    "float32": "vectors.f32",
+    "float16": "vectors.f16",
+    "int8": "vectors.i8",
+}
+SCALES_FILE_NAME = "scales.f32"
+DEFAULT_STORAGE_DTYPE = "float32"
+# Shards are merged into the main matrix once either limit is reached
+COMPACTION_SHARD_COUNT = 16
+COMPACTION_ROW_COUNT = 50_000
+# Size budget for all models together, can be overridden through the environment
+DEFAULT_MAX_CACHE_BYTES = 4 * 1024**3
+DEFAULT_MAX_CACHE_ENTRIES = None
+# Evicting down to a fraction of the budget keeps eviction from running on every save
+EVICTION_TARGET_RATIO = 0.9
+# Counters kept per model in the metadata, see `EmbeddingCache.get_stats`
+CACHE_STAT_NAMES = (
+    "hits",
+    "misses",
+    "bytes_read",
+    "bytes_written",
+    "load_seconds",
+    "evictions",
+)
+# Size budget of the in-process embedding tier
+DEFAULT_MAX_MEMORY_CACHE_BYTES = 512 * 1024**2
+# Number of k sweeps kept on disk, the least recently used are removed
+DEFAULT_MAX_K_SWEEPS = 16
+
+
+class _ColumnarStore:
+    """
+    On-disk embedding store for a single model.
+
+    Vectors are kept as one contiguous row-major matrix that is read
+    through a memory map. A sorted array of 64-bit text keys with the matching row
+    numbers serves as the index, so a lookup only touches the rows it needs.
+    The last access time of every row is tracked in a memory-mapped side file
+    so that least recently used rows can be evicted.
+
+    The matrix can be stored as float32, float16 or int8 with one scale per
+    row, see `quantize_vectors`. Rows are converted back to float32 in bulk
+    when they are looked up.
+
+    New embeddings are not written into the matrix directly. Each save writes a
+    small append-only shard, and once enough shards have piled up they are
+    merged into the matrix by a background compaction thread.
+    """
+
+    def __init__(self, directory: str, storage_dtype: str = DEFAULT_STORAGE_DTYPE):
+        self.directory = directory
+        self.shard_dir = os.path.join(directory, SHARD_DIR_NAME)
+        self.index_file = os.path.join(directory, INDEX_FILE_NAME)
+        self.access_file = os.path.join(directory, ACCESS_FILE_NAME)
+        self.scales_file = os.path.join(directory, SCALES_FILE_NAME)
+        self.keys = np.empty(0, dtype=HASH_DTYPE)
+        self.rows = np.empty(0, dtype=ROW_DTYPE)
+        self.dim: Optional[int] = None
+        # Existing stores keep the format recorded in their index
+        self.storage_dtype = storage_dtype
+        self._vectors: Optional[np.memmap] = None
+        self._scales: Optional[np.memmap] = None
+        self._access: Optional[np.memmap] = None
+
+        # Shards that have not been compacted yet, keyed by sequence number
+        self._shards: Dict[int, tuple[np.ndarray, np.ndarray]] = {}
+        self._shard_access: Dict[int, np.ndarray] = {}
+        self._shard_keys = np.empty(0, dtype=HASH_DTYPE)
+        self._shard_locations = np.empty((0, 2), dtype=np.int64)
+        self._next_shard = 0
+
+        self._lock = threading.RLock()
+        self._compaction_thread: Optional[threading.Thread] = None
+        self._load_index()
+        self.vectors_file = os.path.join(
+            directory, VECTOR_FILE_NAMES[self.storage_dtype]
+        )
+        self._load_shards()
+        self._open_access()
+
+    def __len__(self) -> int:
+        return len(self.keys) + len(self._shard_keys)
+
+    @property
+    def shard_count(self) -> int:
+        return len(self._shards)
+
+    @property
+    def shard_row_count(self) -> int:
+        return len(self._shard_keys)
+
+    def _load_index(self):
+        if not os.path.exists(self.index_file):
+            return
+        with np.load(self.index_file) as index:
+            self.keys = index["keys"].astype(HASH_DTYPE, copy=False)
+            self.rows = index["rows"].astype(ROW_DTYPE, copy=False)
+            self.dim = int(index["dim"]) if index["dim"] > 0 else None
+            self.storage_dtype = str(index["storage_dtype"])
+
+    def _save_index(self):
+        # Write to a temporary file first so a crash never leaves a torn index
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, "wb") as f:
+            np.savez(
+                f,
+                keys=self.keys,
+                rows=self.rows,
+                dim=np.int64(self.dim or 0),
+                storage_dtype=np.array(self.storage_dtype),
+            )
+        os.replace(tmp_file, self.index_file)
+
+    def _shard_paths(self, sequence: int) -> tuple[str, str]:
+        name = f"{sequence:08d}"
+        return (
+            os.path.join(self.shard_dir, f"{name}.keys.npy"),
+            os.path.join(self.shard_dir, f"{name}.vectors.npy"),
+        )
+
+    def _load_shards(self):
+        if not os.path.isdir(self.shard_dir):
+            return
+        for file_name in sorted(os.listdir(self.shard_dir)):
+            if not file_name.endswith(".keys.npy"):
+                continue
+            sequence = int(file_name.split(".")[0])
+            keys_file, vectors_file = self._shard_paths(sequence)
+            try:
+                keys = np.load(keys_file)
+                vectors = np.load(vectors_file, mmap_mode="r")
+            except Exception as e:
+                logger.warning(f"Skipping unreadable embedding cache shard: {e}")
+                continue
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            self._shards[sequence] = (keys, vectors)
+            self._shard_access[sequence] = np.full(
+                len(keys), os.path.getmtime(keys_file), dtype=ACCESS_DTYPE
+            )
+            self._next_shard = max(self._next_shard, sequence + 1)
+        self._rebuild_shard_index()
+
+    def _rebuild_shard_index(self):
+        """Build one sorted key array over all uncompacted shards"""
+        if not self._shards:
+            self._shard_keys = np.empty(0, dtype=HASH_DTYPE)
+            self._shard_locations = np.empty((0, 2), dtype=np.int64)
+            return
+        keys = np.concatenate([keys for keys, _ in self._shards.values()])
+        locations = np.concatenate(
+            [
+                np.column_stack(
+                    [np.full(len(keys), sequence), np.arange(len(keys))]
+                )
+                for sequence, (keys, _) in self._shards.items()
+            ]
+        )
+        order = np.argsort(keys, kind="stable")
+        self._shard_keys, self._shard_locations = keys[order], locations[order]
+
+    def _row_count(self) -> int:
+        if not self.dim or not os.path.exists(self.vectors_file):
+            return 0
+        row_size = self.dim * STORAGE_DTYPES[self.storage_dtype].itemsize
+        return os.path.getsize(self.vectors_file) // row_size
+
+    def _open_access(self):
+        """Open the access time file, creating it if it is missing or stale"""
+        row_count = self._row_count()
+        if row_count == 0:
+            self._access = None
+            return
+        if os.path.exists(self.access_file):
+            try:
+                access = np.load(self.access_file, mmap_mode="r+")
+                if access.shape == (row_count,):
+                    self._access = access
+                    return
+            except Exception as e:
+                logger.warning(f"Failed to load embedding cache access times: {e}")
+        # Stores without access times count as accessed now
+        self._write_access(np.full(row_count, time.time(), dtype=ACCESS_DTYPE))
+
+    def _write_access(self, access: np.ndarray):
+        self._access = None
+        tmp_file = self.access_file + ".tmp"
+        with open(tmp_file, "wb") as f:
+            np.save(f, access)
+        os.replace(tmp_file, self.access_file)
+        self._access = np.load(self.access_file, mmap_mode="r+")
+
+    def _get_vectors(self) -> Optional[np.memmap]:
+        if self._vectors is None:
+            row_count = self._row_count()
+            if row_count == 0:
+                return None
+            self._vectors = np.memmap(
+                self.vectors_file,
+                dtype=STORAGE_DTYPES[self.storage_dtype],
+                mode="r",
+                shape=(row_count, self.dim),
+            )
+        return self._vectors
+
+    def _get_scales(self) -> Optional[np.memmap]:
+        """Per-row scales of an int8 matrix, None for the float formats"""
+        if self.storage_dtype != "int8":
+            return None
+        if self._scales is None:
+            row_count = self._row_count()
+            if row_count == 0:
+                return None
+            self._scales = np.memmap(
+                self.scales_file, dtype=SCALE_DTYPE, mode="r", shape=(row_count,)
+            )
+        return self._scales
+
+    def _contains(self, keys: np.ndarray) -> np.ndarray:
+        """Check which keys are already stored in the matrix or a shard"""
+        contained = np.zeros(len(keys), dtype=bool)
+        for sorted_keys in (self.keys, self._shard_keys):
+            if len(sorted_keys) == 0:
+                continue
+            positions = np.minimum(
+                np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1
+            )
+            contained |= sorted_keys[positions] == keys
+        return contained
+
+    def lookup(self, keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Look up a batch of hashes.
+
+        Returns:
+            A boolean mask of the keys that were found and the matching vectors
+            in the order of the found keys.
+        """
+        with self._lock:
+            found = np.zeros(len(keys), dtype=bool)
+            result = np.empty((len(keys), self.dim or 0), dtype=VECTOR_DTYPE)
+            if len(keys) == 0 or self.dim is None:
+                return found, result[:0]
+
+            now = time.time()
+            vectors = self._get_vectors()
+            if len(self.keys) > 0 and vectors is not None:
+                positions = np.minimum(
+                    np.searchsorted(self.keys, keys), len(self.keys) - 1
+                )
+                in_matrix = self.keys[positions] == keys
+                rows = self.rows[positions[in_matrix]].astype(np.int64)
+                # Read the rows in file order so the memory map is walked sequentially
+                order = np.argsort(rows, kind="stable")
+                targets = np.flatnonzero(in_matrix)
+                scales = self._get_scales()
+                result[targets[order]] = dequantize_vectors(
+                    vectors[rows[order]],
+                    scales[rows[order]] if scales is not None else None,
+                )
+                found |= in_matrix
+                if self._access is not None:
+                    self._access[rows] = now
+
+            if len(self._shard_keys) > 0:
+                positions = np.minimum(
+                    np.searchsorted(self._shard_keys, keys), len(self._shard_keys) - 1
+                )
+                in_shard = (self._shard_keys[positions] == keys) & ~found
+                for target, (sequence, row) in zip(
+                    np.flatnonzero(in_shard), self._shard_locations[positions[in_shard]]
+                ):
+                    result[target] = self._shards[int(sequence)][1][row]
+                    self._shard_access[int(sequence)][row] = now
+                found |= in_shard
+
+            return found, result[found]
+
+    def write_shard(self, keys: np.ndarray, vectors: np.ndarray) -> int:
+        """
+        Write new embeddings into a fresh shard.
+
+        Only the given rows are written, so the cost does not depend on the
+        size of the cache. Returns the number of rows that were new.
+        """
+        with self._lock:
+            vectors = np.ascontiguousarray(vectors, dtype=VECTOR_DTYPE)
+            if len(keys) == 0:
+                return 0
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match cache dimension {self.dim}"
+                )
+
+            # Drop keys that are already stored or duplicated within the batch
+            keys, unique_indices = np.unique(keys, return_index=True)
+            vectors = vectors[unique_indices]
+            new = ~self._contains(keys)
+            keys, vectors = keys[new], vectors[new]
+            if len(keys) == 0:
+                return 0
+
+            os.makedirs(self.shard_dir, exist_ok=True)
+            sequence = self._next_shard
+            self._next_shard += 1
+            keys_file, vectors_file = self._shard_paths(sequence)
+            # The keys file marks a complete shard, so it is written last
+            np.save(vectors_file, vectors)
+            np.save(keys_file, keys)
+
+            self._shards[sequence] = (keys, np.load(vectors_file, mmap_mode="r"))
+            self._shard_access[sequence] = np.full(
+                len(keys), time.time(), dtype=ACCESS_DTYPE
+            )
+            self._rebuild_shard_index()
+            return len(keys)
+
+    def needs_compaction(self) -> bool:
+        return (
+            self.shard_count >= COMPACTION_SHARD_COUNT
+            or self.shard_row_count >= COMPACTION_ROW_COUNT
+        )
+
+    def compact_in_background(self, on_complete: Optional[Callable[[], None]] = None):
+        """Start a compaction thread unless one is already running"""
+        with self._lock:
+            if self._compaction_thread and self._compaction_thread.is_alive():
+                return
+            self._compaction_thread = threading.Thread(
+                target=self._compact_safely,
+                args=(on_complete,),
+                name="embedding-cache-compaction",
+            )
+            self._compaction_thread.start()
+
+    def wait_for_compaction(self):
+        thread = self._compaction_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _compact_safely(self, on_complete: Optional[Callable[[], None]]):
+        try:
+            self.compact()
+            if on_complete is not None:
+                on_complete()
+        except Exception as e:
+            logger.warning(f"Failed to compact embedding cache: {e}")
+
+    def compact(self):
+        """Merge all shards into the matrix file and index, then delete them"""
+        with self._lock:
+            if not self._shards:
+                return
+            start_time = time.time()
+            sequences = sorted(self._shards.keys())
+            keys = np.concatenate([self._shards[s][0] for s in sequences])
+            vectors = np.concatenate([self._shards[s][1] for s in sequences])
+            shard_access = np.concatenate([self._shard_access[s] for s in sequences])
+
+            # Release the memory maps before the files grow
+            self._vectors = None
+            self._scales = None
+            os.makedirs(self.directory, exist_ok=True)
+            first_row = self._row_count()
+            stored, scales = quantize_vectors(vectors, self.storage_dtype)
+            storage_dtype = STORAGE_DTYPES[self.storage_dtype]
+            with open(self.vectors_file, "ab") as f:
+                # Truncate a partially written trailing row left behind by a crash
+                f.truncate(first_row * self.dim * storage_dtype.itemsize)
+                f.write(np.ascontiguousarray(stored).tobytes())
+            if scales is not None:
+                with open(self.scales_file, "ab") as f:
+                    f.truncate(first_row * SCALE_DTYPE.itemsize)
+                    f.write(np.ascontiguousarray(scales).tobytes())
+
+            new_rows = np.arange(first_row, first_row + len(keys), dtype=ROW_DTYPE)
+            all_keys = np.concatenate([self.keys, keys])
+            all_rows = np.concatenate([self.rows, new_rows])
+            order = np.argsort(all_keys, kind="stable")
+            self.keys, self.rows = all_keys[order], all_rows[order]
+            self._save_index()
+
+            access = np.full(first_row + len(keys), time.time(), dtype=ACCESS_DTYPE)
+            if self._access is not None:
+                previous_rows = min(len(self._access), first_row)
+                access[:previous_rows] = self._access[:previous_rows]
+            access[first_row:] = shard_access
+            self._write_access(access)
+
+            # Drop the shard memory maps before deleting their files
+            self._shards.clear()
+            self._shard_access.clear()
+            self._rebuild_shard_index()
+            del vectors, stored
+            for sequence in sequences:
+                for path in self._shard_paths(sequence):
+                    if os.path.exists(path):
+                        os.remove(path)
+            logger.info(
+                f"Compacted {len(sequences)} embedding cache shards ({len(keys)} rows) in {time.time() - start_time:.2f}s"
+            )
+
+    def entry_size(self) -> int:
+        """Approximate number of bytes one entry takes on disk"""
+        size = (self.dim or 0) * STORAGE_DTYPES[self.storage_dtype].itemsize + (
+            HASH_DTYPE.itemsize + ROW_DTYPE.itemsize + ACCESS_DTYPE.itemsize
+        )
+        if self.storage_dtype == "int8":
+            size += SCALE_DTYPE.itemsize
+        return size
+
+    def access_times(self) -> np.ndarray:
+        """Last access time of every compacted entry, in index order"""
+        with self._lock:
+            if self._access is None or len(self.keys) == 0:
+                return np.empty(0, dtype=ACCESS_DTYPE)
+            return np.asarray(self._access[self.rows.astype(np.int64)])
+
+    def evict(self, evict_mask: np.ndarray) -> int:
+        """
+        Remove entries from the store.
+
+        Args:
+            evict_mask: Boolean mask in index order, as returned by `access_times`
+
+        Returns:
+            The number of evicted entries
+        """
+        with self._lock:
+            evicted = int(np.count_nonzero(evict_mask))
+            if evicted == 0:
+                return 0
+            self._rewrite(~evict_mask, self.storage_dtype)
+            return evicted
+
+    def convert(self, storage_dtype: str):
+        """Rewrite the compacted matrix in another storage format"""
+        with self._lock:
+            if storage_dtype == self.storage_dtype:
+                return
+            if len(self.keys) == 0:
+                self.storage_dtype = storage_dtype
+                self.vectors_file = os.path.join(
+                    self.directory, VECTOR_FILE_NAMES[storage_dtype]
+                )
+                self._save_index()
+                return
+            start_time = time.time()
+            previous_dtype = self.storage_dtype
+            self._rewrite(np.ones(len(self.keys), dtype=bool), storage_dtype)
+            logger.info(
+                f"Converted {len(self.keys)} cached embeddings from {previous_dtype} to {storage_dtype} in {time.time() - start_time:.2f}s"
+            )
+
+    def _rewrite(self, keep: np.ndarray, storage_dtype: str):
+        """Rewrite the matrix with only the kept entries, in the given format"""
+        vectors = self._get_vectors()
+        scales = self._get_scales()
+        assert vectors is not None and self._access is not None
+        kept_keys = self.keys[keep]
+        kept_rows = self.rows[keep].astype(np.int64)
+        order = np.argsort(kept_rows, kind="stable")
+        sorted_rows = kept_rows[order]
+
+        # Copy the surviving rows into new files in chunks
+        vectors_file = os.path.join(self.directory, VECTOR_FILE_NAMES[storage_dtype])
+        tmp_vectors_file = vectors_file + ".tmp"
+        tmp_scales_file = self.scales_file + ".tmp"
+        with open(tmp_vectors_file, "wb") as f, open(tmp_scales_file, "wb") as f_scales:
+            for start in range(0, len(sorted_rows), 8192):
+                chunk = sorted_rows[start : start + 8192]
+                stored = vectors[chunk]
+                chunk_scales = scales[chunk] if scales is not None else None
+                if storage_dtype != self.storage_dtype:
+                    stored, chunk_scales = quantize_vectors(
+                        dequantize_vectors(stored, chunk_scales), storage_dtype
+                    )
+                f.write(np.ascontiguousarray(stored).tobytes())
+                if chunk_scales is not None:
+                    f_scales.write(np.ascontiguousarray(chunk_scales).tobytes())
+        access = np.asarray(self._access[sorted_rows])
+
+        self._vectors = None
+        self._scales = None
+        self._access = None
+        del vectors, scales
+        previous_vectors_file = self.vectors_file
+        os.replace(tmp_vectors_file, vectors_file)
+        if storage_dtype == "int8":
+            os.replace(tmp_scales_file, self.scales_file)
+        else:
+            os.remove(tmp_scales_file)
+
+        new_rows = np.empty(len(kept_rows), dtype=ROW_DTYPE)
+        new_rows[order] = np.arange(len(kept_rows), dtype=ROW_DTYPE)
+        self.keys, self.rows = kept_keys, new_rows
+        self.storage_dtype = storage_dtype
+        self.vectors_file = vectors_file
+        self._save_index()
+        # The old files are only removed once the index points to the new ones
+        if previous_vectors_file != vectors_file:
+            os.remove(previous_vectors_file)
+        if storage_dtype != "int8" and os.path.exists(self.scales_file):
+            os.remove(self.scales_file)
+        if len(access) > 0:
+            self._write_access(access)
+        elif os.path.exists(self.access_file):
+            os.remove(self.access_file)
+
+    def close(self):
+        self.wait_for_compaction()
+        with self._lock:
+            if self._access is not None:
+                self._access.flush()
+            self._vectors = None
+            self._scales = None
+            self._access = None
+            self._shards.clear()
+            self._shard_access.clear()
+            self._rebuild_shard_index()
+
+
+def quantize_vectors(
+    vectors: np.ndarray, storage_dtype: str
+) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Convert float32 vectors into a storage format.
+
+    float16 halves the size of a vector. int8 quarters it, every row is
+    scaled so that its largest absolute component maps to 127 and the scale
+    is returned alongside.
+
+    Returns:
+        The stored vectors and the per-row scales, or None for the float formats
+    """
+    vectors = np.asarray(vectors, dtype=VECTOR_DTYPE)
+    if storage_dtype != "int8":
+        return vectors.astype(STORAGE_DTYPES[storage_dtype]), None
+    scales = np.abs(vectors).max(axis=1) / 127
+    # All-zero rows would divide by zero, any scale reproduces them
+    scales[scales == 0] = 1
+    stored = np.rint(vectors / scales[:, None]).astype(STORAGE_DTYPES["int8"])
+    return stored, scales.astype(SCALE_DTYPE)
+
+
+def dequantize_vectors(
+    stored: np.ndarray, scales: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Convert stored vectors back to float32, see `quantize_vectors`"""
+    vectors = np.asarray(stored).astype(VECTOR_DTYPE)
+    if vectors.dtype == stored.dtype:
+        return vectors
+    if scales is not None:
+        vectors *= np.asarray(scales)[:, None]
+    # Embeddings are cached normalized, so the rounding error in the norm is removed
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+def get_text_keys(texts: Iterable[str]) -> np.ndarray:
+    """
+    Hash a batch of texts into cache keys.
+
+    The truncated digests are joined into one buffer that is converted into
+    the key array in a single step.
+    """
+    md5 = hashlib.md5
+    digests = b"".join([md5(text.encode("utf-8")).digest()[:8] for text in texts])
+    return np.frombuffer(digests, dtype=HASH_DTYPE).copy()
+
+
+def _hex_to_keys(hex_digests: np.ndarray) -> np.ndarray:
+    """Convert the md5 hex digests used as keys by the legacy pickle cache"""
+    digests = b"".join(
+        [bytes.fromhex(digest[:16].decode("ascii")) for digest in hex_digests]
+    )
+    return np.frombuffer(digests, dtype=HASH_DTYPE).copy()
+
+
+def _get_storage_dtype() -> str:
+    value = os.environ.get("EMBEDDING_CACHE_DTYPE")
+    if not value:
+        return DEFAULT_STORAGE_DTYPE
+    if value not in STORAGE_DTYPES:
+        logger.warning(f"Ignoring invalid value for EMBEDDING_CACHE_DTYPE: {value}")
+        return DEFAULT_STORAGE_DTYPE
+    return value
 
 
 class EmbeddingCache:
     """
     Cache for storing embeddings to avoid recalculating them.
     The cache is stored on disk and is keyed by model name and text content.
+    Each model gets its own columnar store, see `_ColumnarStore`.
+
+    The total size is bounded by an entry and a byte budget. When the cache
+    outgrows either of them, the least recently used entries are evicted.
+
+    Vectors are stored as float32 unless a smaller format is configured with
+    `storage_dtype` or the EMBEDDING_CACHE_DTYPE environment variable. Stores
+    in another format are converted when they are opened.
+
+    Hits, misses, bytes read and written, lookup time and evictions are
+    counted per model in memory and persisted in the metadata across
+    sessions by `flush_stats`, which the owner calls once a run is done.
+
+    The cache is shared by the main and the precompute thread, so the open
+    stores and the metadata are guarded by one lock. Background compactions
+    never take it, their results are applied by the next save or flush.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        storage_dtype: Optional[str] = None,
+    ):
         logger.debug("Initializing EmbeddingCache")
+        self.max_entries = max_entries or get_env_int(
+            "EMBEDDING_CACHE_MAX_ENTRIES", DEFAULT_MAX_CACHE_ENTRIES
+        )
+        self.max_bytes = max_bytes or get_env_int(
+            "EMBEDDING_CACHE_MAX_BYTES", DEFAULT_MAX_CACHE_BYTES
+        )
+        self.storage_dtype = storage_dtype or _get_storage_dtype()
         self.cache_dir = os.path.join(get_user_data_path(), "cache", "embeddings")
         os.makedirs(self.cache_dir, exist_ok=True)
         self.metadata_file = os.path.join(self.cache_dir, "metadata.json")
         self.metadata = self._load_metadata()
+        self._stores: Dict[str, _ColumnarStore] = {}
+        self._lock = threading.RLock()
+        # Models whose store finished a background compaction since the
+        # metadata and the budget were last updated
+        self._compacted_models: set[str] = set()
+        # Set when the counters changed since the metadata was last written
+        self._stats_dirty = False
         logger.debug(f"Loaded embedding cache metadata: {self.metadata}")
 
     def _load_metadata(self) -> Dict[str, Any]:
@@ -28,29 +673,138 @@ class EmbeddingCache:
         if os.path.exists(self.metadata_file):
             try:
                 with open(self.metadata_file, "r") as f:
-                    return json.load(f)
+                    metadata = json.load(f)
+                metadata.setdefault("stats", {})
+                return metadata
             except Exception as e:
                 logger.warning(f"Failed to load embedding cache metadata: {e}")
-                return {"models": {}}
-        return {"models": {}}
+                return {"models": {}, "stats": {}}
+        return {"models": {}, "stats": {}}
 
     def _save_metadata(self):
-        """Save metadata to disk"""
+        """Save metadata to disk, replacing the old file in one step"""
         try:
-            with open(self.metadata_file, "w") as f:
-                json.dump(self.metadata, f)
+            with self._lock:
+                self.metadata["version"] = CACHE_FORMAT_VERSION
+                tmp_file = f"{self.metadata_file}.tmp"
+                with open(tmp_file, "w") as f:
+                    json.dump(self.metadata, f)
+                os.replace(tmp_file, self.metadata_file)
+                self._stats_dirty = False
         except Exception as e:
             logger.warning(f"Failed to save embedding cache metadata: {e}")
 
+    def _get_safe_name(self, model_name: str) -> str:
+        """Create a safe file name from the model name"""
+        return model_name.replace("/", "_").replace("\\", "_")
+
     def _get_cache_file_path(self, model_name: str) -> str:
-        """Get the path to the cache file for a model"""
-        # Create a safe filename from the model name
-        safe_name = model_name.replace("/", "_").replace("\\", "_")
-        return os.path.join(self.cache_dir, f"{safe_name}.pkl")
+        """Get the path to the legacy pickle cache file for a model"""
+        return os.path.join(self.cache_dir, f"{self._get_safe_name(model_name)}.pkl")
+
+    def _get_store_dir(self, model_name: str) -> str:
+        """Get the path to the columnar store directory for a model"""
+        return os.path.join(self.cache_dir, self._get_safe_name(model_name))
+
+    def _get_store(self, model_name: str) -> Optional[_ColumnarStore]:
+        """Open the store for a model, migrating a legacy pickle cache if needed"""
+        with self._lock:
+            if model_name in self._stores:
+                return self._stores[model_name]
+
+            store_dir = self._get_store_dir(model_name)
+            legacy_file = self._get_cache_file_path(model_name)
+            if not os.path.isdir(store_dir) and not os.path.exists(legacy_file):
+                return None
 
-    def _get_text_hash(self, text: str) -> str:
-        """Generate a hash for the text to use as a cache key"""
-        return hashlib.md5(text.encode("utf-8")).hexdigest()
+            store = _ColumnarStore(store_dir, self.storage_dtype)
+            if os.path.exists(legacy_file):
+                self._migrate_legacy_cache(model_name, store, legacy_file)
+            if store.storage_dtype != self.storage_dtype:
+                try:
+                    store.compact()
+                    store.convert(self.storage_dtype)
+                    self._update_model_metadata(model_name, store)
+                except Exception as e:
+                    logger.warning(f"Failed to convert embedding cache format: {e}")
+            self._stores[model_name] = store
+            return store
+
+    def _migrate_legacy_cache(
+        self, model_name: str, store: _ColumnarStore, legacy_file: str
+    ):
+        """Move the embeddings of a pickle cache file into the columnar store"""
+        logger.info(f"Migrating legacy embedding cache for model {model_name}")
+        try:
+            with open(legacy_file, "rb") as f:
+                cache_data: Dict[str, np.ndarray] = pickle.load(f)
+            if cache_data:
+                keys = _hex_to_keys(np.array(list(cache_data.keys()), dtype="S32"))
+                vectors = np.stack(list(cache_data.values()))
+                store.write_shard(keys, vectors)
+                store.compact()
+            os.remove(legacy_file)
+            self._update_model_metadata(model_name, store)
+            logger.info(
+                f"Migrated {len(cache_data)} embeddings for model {model_name}"
+            )
+        except Exception as e:
+            logger.warning(f"Failed to migrate legacy embedding cache: {e}")
+
+    def _update_model_metadata(self, model_name: str, store: _ColumnarStore):
+        with self._lock:
+            self.metadata["models"][model_name] = {
+                "count": len(store),
+                "dim": store.dim,
+                "dtype": store.storage_dtype,
+                "last_updated": time.time(),
+            }
+            self._save_metadata()
+
+    def _record_stats(self, model_name: str, **increments: float):
+        """Add to the counters of a model, they are written by `flush_stats`"""
+        with self._lock:
+            stats = self.metadata["stats"].setdefault(
+                model_name, {name: 0 for name in CACHE_STAT_NAMES}
+            )
+            for name, increment in increments.items():
+                stats[name] = stats.get(name, 0) + increment
+            self._stats_dirty = True
+
+    def flush_stats(self):
+        """
+        Apply finished background compactions and persist the counters if they
+        changed since the metadata was last written
+        """
+        with self._lock:
+            self._apply_compactions()
+            if self._stats_dirty:
+                self._save_metadata()
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """Entries and persisted counters of every model that has any"""
+        with self._lock:
+            model_names = list(self.metadata["models"].keys())
+            model_names += [
+                name for name in self.metadata["stats"] if name not in model_names
+            ]
+            result = []
+            for model_name in model_names:
+                model_metadata = self.metadata["models"].get(model_name, {})
+                stats = {name: 0 for name in CACHE_STAT_NAMES}
+                stats.update(self.metadata["stats"].get(model_name, {}))
+                lookups = stats["hits"] + stats["misses"]
+                result.append(
+                    {
+                        "model_name": model_name,
+                        "entries": model_metadata.get("count", 0),
+                        "dim": model_metadata.get("dim"),
+                        "dtype": model_metadata.get("dtype"),
+                        **stats,
+                        "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+                    }
+                )
+            return result
 
     def get_embeddings(
         self, model_name: str, texts: List[str]
@@ -66,27 +820,34 @@ class EmbeddingCache:
             Dictionary mapping text to embedding or None if not in cache
         """
         result: Dict[str, Optional[np.ndarray]] = {text: None for text in texts}
-
-        # Check if model exists in cache
-        if model_name not in self.metadata["models"]:
-            return result
-
-        cache_file = self._get_cache_file_path(model_name)
-        if not os.path.exists(cache_file):
+        if not texts:
             return result
 
+        start_time = time.time()
+        hits = 0
+        bytes_read = 0
         try:
-            with open(cache_file, "rb") as f:
-                cache_data = pickle.load(f)
-
-            # Get embeddings for each text if available
-            for text in texts:
-                text_hash = self._get_text_hash(text)
-                if text_hash in cache_data:
-                    result[text] = cache_data[text_hash]
+            with self._lock:
+                store = self._get_store(model_name)
+                if store is not None and len(store) > 0:
+                    found, vectors = store.lookup(get_text_keys(texts))
+                    found_texts = [
+                        text for text, is_found in zip(texts, found) if is_found
+                    ]
+                    for text, vector in zip(found_texts, vectors):
+                        result[text] = vector
+                    hits = len(found_texts)
+                    bytes_read = hits * store.entry_size()
         except Exception as e:
             logger.warning(f"Failed to load embeddings from cache: {e}")
 
+        self._record_stats(
+            model_name,
+            hits=hits,
+            misses=len(result) - hits,
+            bytes_read=bytes_read,
+            load_seconds=time.time() - start_time,
+        )
         return result
 
     def save_embeddings(self, model_name: str, embeddings: Dict[str, np.ndarray]):
@@ -97,40 +858,155 @@ class EmbeddingCache:
             model_name: Name of the embedding model
             embeddings: Dictionary mapping text to embedding
         """
-        cache_file = self._get_cache_file_path(model_name)
-
-        # Load existing cache data if available
-        cache_data = {}
-        if os.path.exists(cache_file):
-            try:
-                with open(cache_file, "rb") as f:
-                    cache_data = pickle.load(f)
-            except Exception as e:
-                logger.warning(f"Failed to load existing cache data: {e}")
+        if not embeddings:
+            return
 
-        # Add new embeddings to cache
-        for text, embedding in embeddings.items():
-            text_hash = self._get_text_hash(text)
-            cache_data[text_hash] = embedding
-
-        # Save cache data
         try:
-            with open(cache_file, "wb") as f:
-                pickle.dump(cache_data, f)
+            with self._lock:
+                self._apply_compactions()
+                store = self._get_store(model_name)
+                if store is None:
+                    store = _ColumnarStore(
+                        self._get_store_dir(model_name), self.storage_dtype
+                    )
+                    self._stores[model_name] = store
 
-            # Update metadata
-            self.metadata["models"][model_name] = {
-                "count": len(cache_data),
-                "last_updated": os.path.getmtime(cache_file),
-            }
-            self._save_metadata()
+                written = store.write_shard(
+                    get_text_keys(embeddings.keys()),
+                    np.stack(list(embeddings.values())),
+                )
+                # The metadata is refreshed after the compaction, only new
+                # models are registered right away so they can be cleared
+                if model_name not in self.metadata["models"]:
+                    self._update_model_metadata(model_name, store)
+                self._record_stats(
+                    model_name, bytes_written=written * store.entry_size()
+                )
+                if store.needs_compaction():
+                    store.compact_in_background(
+                        on_complete=lambda: self._compacted_models.add(model_name)
+                    )
 
             logger.info(
-                f"Saved {len(embeddings)} embeddings to cache for model {model_name}"
+                f"Saved {written} embeddings to cache for model {model_name}"
             )
         except Exception as e:
             logger.warning(f"Failed to save embeddings to cache: {e}")
 
+    def _apply_compactions(self):
+        """
+        Refresh the metadata of the models compacted in the background and
+        enforce the budget. The compaction threads leave this to the cache's
+        users because they would deadlock on the lock of a user that waits
+        for them to finish.
+        """
+        with self._lock:
+            if not self._compacted_models:
+                return
+            while self._compacted_models:
+                model_name = self._compacted_models.pop()
+                store = self._stores.get(model_name)
+                if store is not None and model_name in self.metadata["models"]:
+                    self._update_model_metadata(model_name, store)
+            self.enforce_budget()
+
+    def _open_model_stores(self) -> Dict[str, _ColumnarStore]:
+        with self._lock:
+            stores = {}
+            for model_name in list(self.metadata["models"].keys()):
+                store = self._get_store(model_name)
+                if store is not None:
+                    stores[model_name] = store
+            return stores
+
+    def _evict_from_store(
+        self, model_name: str, store: _ColumnarStore, evict_mask: np.ndarray
+    ) -> int:
+        evicted = store.evict(evict_mask)
+        if evicted == 0:
+            return 0
+        self._record_stats(model_name, evictions=evicted)
+        if len(store) == 0:
+            self.clear_cache(model_name)
+        else:
+            self._update_model_metadata(model_name, store)
+        return evicted
+
+    def enforce_budget(self):
+        """
+        Evict the least recently used entries across all models until the
+        cache fits into its entry and byte budget again.
+        """
+        with self._lock:
+            if self.max_entries is None and self.max_bytes is None:
+                return
+            stores = self._open_model_stores()
+            for store in stores.values():
+                store.compact()
+
+            access_times = {
+                name: store.access_times() for name, store in stores.items()
+            }
+            total_entries = sum(len(times) for times in access_times.values())
+            total_bytes = sum(
+                len(access_times[name]) * store.entry_size()
+                for name, store in stores.items()
+            )
+            over_entries = (
+                self.max_entries is not None and total_entries > self.max_entries
+            )
+            over_bytes = self.max_bytes is not None and total_bytes > self.max_bytes
+            if not over_entries and not over_bytes:
+                return
+
+            # Rank all entries from most to least recently used and keep the
+            # longest prefix that fits into the target
+            names = list(stores.keys())
+            all_times = np.concatenate([access_times[name] for name in names])
+            all_sizes = np.concatenate(
+                [np.full(len(access_times[name]), stores[name].entry_size()) for name in names]
+            )
+            order = np.argsort(-all_times, kind="stable")
+            keep = np.ones(len(all_times), dtype=bool)
+            if self.max_entries is not None:
+                keep[order[int(self.max_entries * EVICTION_TARGET_RATIO) :]] = False
+            if self.max_bytes is not None:
+                cumulative_bytes = np.cumsum(all_sizes[order])
+                keep[order[cumulative_bytes > self.max_bytes * EVICTION_TARGET_RATIO]] = False
+
+            evicted = 0
+            offset = 0
+            for name in names:
+                count = len(access_times[name])
+                evicted += self._evict_from_store(
+                    name, stores[name], ~keep[offset : offset + count]
+                )
+                offset += count
+            logger.info(
+                f"Evicted {evicted} least recently used embeddings to stay within the cache budget"
+            )
+
+    def close(self):
+        """Wait for running compactions, release all open stores and persist the counters"""
+        with self._lock:
+            for store in self._stores.values():
+                store.wait_for_compaction()
+            self.flush_stats()
+            for store in self._stores.values():
+                store.close()
+            self._stores.clear()
+
+    def _remove_model_files(self, model_name: str):
+        store = self._stores.pop(model_name, None)
+        if store is not None:
+            store.close()
+        store_dir = self._get_store_dir(model_name)
+        if os.path.isdir(store_dir):
+            shutil.rmtree(store_dir)
+        legacy_file = self._get_cache_file_path(model_name)
+        if os.path.exists(legacy_file):
+            os.remove(legacy_file)
+
     def clear_cache(self, model_name: Optional[str] = None):
         """
         Clear the cache for a specific model or all models.
@@ -138,42 +1014,305 @@ class EmbeddingCache:
         Args:
             model_name: Name of the model to clear cache for, or None to clear all
         """
-        if model_name is None:
-            # Clear all caches
-            for model in list(self.metadata["models"].keys()):
-                cache_file = self._get_cache_file_path(model)
-                if os.path.exists(cache_file):
-                    os.remove(cache_file)
-            self.metadata["models"] = {}
-            self._save_metadata()
-            logger.info("Cleared all embedding caches")
-        elif model_name in self.metadata["models"]:
-            # Clear specific model cache
-            cache_file = self._get_cache_file_path(model_name)
-            if os.path.exists(cache_file):
-                os.remove(cache_file)
-            del self.metadata["models"][model_name]
-            self._save_metadata()
-            logger.info(f"Cleared embedding cache for model {model_name}")
+        with self._lock:
+            if model_name is None:
+                # Clear all caches
+                for model in list(self.metadata["models"].keys()):
+                    self._remove_model_files(model)
+                self.metadata["models"] = {}
+                self._save_metadata()
+                logger.info("Cleared all embedding caches")
+            elif model_name in self.metadata["models"]:
+                # Clear specific model cache
+                self._remove_model_files(model_name)
+                del self.metadata["models"][model_name]
+                self._save_metadata()
+                logger.info(f"Cleared embedding cache for model {model_name}")
 
     def clear_expired_caches(self, max_age_days: float = 30.0):
         """
-        Clear any model caches that are older than the specified age.
+        Evict all entries that have not been used for longer than the specified age.
 
         Args:
-            max_age_days: Maximum age in days before a cache is considered expired
+            max_age_days: Maximum age in days since the last access before an
+                entry is considered expired
         """
-        current_time = time.time()
-        max_age_seconds = max_age_days * 24 * 60 * 60
+        with self._lock:
+            cutoff = time.time() - max_age_days * 24 * 60 * 60
 
-        for model_name, metadata in list(self.metadata["models"].items()):
-            cache_age = current_time - metadata["last_updated"]
-            if cache_age > max_age_seconds:
-                self.clear_cache(model_name)
-                logger.info(
-                    f"Cleared expired cache for model {model_name} (age: {cache_age / (24 * 60 * 60):.1f} days)"
+            for model_name, store in self._open_model_stores().items():
+                store.compact()
+                evicted = self._evict_from_store(
+                    model_name, store, store.access_times() < cutoff
                 )
-            else:
                 logger.info(
-                    f"Skipping cache for model {model_name} (age: {cache_age / (24 * 60 * 60):.1f} days)"
+                    f"Cleared {evicted} expired embeddings for model {model_name} ({len(store)} remaining)"
                 )
+
+
+class MemoryEmbeddingCache:
+    """
+    Bounded in-process tier in front of the `EmbeddingCache`.
+
+    Entries are keyed by model name and text hash and kept in least recently
+    used order. The tier lives as long as the controller, so repeated runs on
+    the same file do not have to touch the disk cache at all.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes or get_env_int(
+            "EMBEDDING_MEMORY_CACHE_MAX_BYTES", DEFAULT_MAX_MEMORY_CACHE_BYTES
+        )
+        self._entries: OrderedDict[tuple[str, int], np.ndarray] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """Number of bytes held by the cached vectors"""
+        return self._size
+
+    def get_embeddings(
+        self, model_name: str, texts: List[str]
+    ) -> Dict[str, Optional[np.ndarray]]:
+        """
+        Get embeddings from memory.
+
+        Args:
+            model_name: Name of the embedding model
+            texts: List of texts to get embeddings for
+
+        Returns:
+            Dictionary mapping text to embedding or None if not in memory
+        """
+        result: Dict[str, Optional[np.ndarray]] = {}
+        keys = get_text_keys(texts).tolist()
+        with self._lock:
+            for text, text_key in zip(texts, keys):
+                key = (model_name, text_key)
+                embedding = self._entries.get(key)
+                if embedding is not None:
+                    self._entries.move_to_end(key)
+                result[text] = embedding
+        return result
+
+    def save_embeddings(self, model_name: str, embeddings: Mapping[str, np.ndarray]):
+        """
+        Keep embeddings in memory, evicting the least recently used ones if
+        the tier outgrows its budget.
+
+        Args:
+            model_name: Name of the embedding model
+            embeddings: Dictionary mapping text to embedding
+        """
+        keys = get_text_keys(embeddings.keys()).tolist()
+        with self._lock:
+            for text_key, embedding in zip(keys, embeddings.values()):
+                key = (model_name, text_key)
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self._size -= previous.nbytes
+                # Copied, a row view would keep the caller's whole batch alive
+                embedding = np.array(embedding, copy=True)
+                self._entries[key] = embedding
+                self._size += embedding.nbytes
+
+            while self._entries and self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class KSweepCache:
+    """
+    Labels and raw metrics of k selection sweeps, so that a run which only
+    changes the metric weights or the selected metrics can re-score the
+    cluster counts without fitting them again.
+
+    Sweeps are keyed by a digest of the embeddings, the weights and the
+    parameters that determine the fits. Every sweep is one .npz file with
+    the labels of each evaluated cluster count and its metrics, NaN where a
+    metric was not computed. Only the most recently used sweeps are kept.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or get_env_int(
+            "K_SWEEP_CACHE_MAX_ENTRIES", DEFAULT_MAX_K_SWEEPS
+        )
+        self.cache_dir = os.path.join(get_user_data_path(), "cache", "k_selection")
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def get_key(embeddings: np.ndarray, weights: np.ndarray, **parameters: Any) -> str:
+        """Digest of the sweep inputs and the parameters that determine the fits"""
+        digest = hashlib.md5()
+        for array in (embeddings, weights):
+            array = np.ascontiguousarray(array)
+            digest.update(f"{array.dtype.str}{array.shape}".encode())
+            digest.update(array.data)
+        digest.update(json.dumps(parameters, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def load(self, key: str) -> Dict[int, tuple[np.ndarray, Dict[str, float]]]:
+        """Labels and known metrics by cluster count, empty if the sweep is unknown"""
+        path = self._get_path(key)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with np.load(path) as data:
+                k_values = data["k"]
+                labels = data["labels"]
+                metrics = {
+                    name[len("metric_") :]: data[name]
+                    for name in data.files
+                    if name.startswith("metric_")
+                }
+            # The modification time orders the sweeps for eviction
+            os.utime(path)
+        except Exception as e:
+            logger.warning(f"Failed to load k sweep {key}: {e}")
+            return {}
+        return {
+            int(k): (
+                labels[i].astype(np.int64),
+                {
+                    name: float(values[i])
+                    for name, values in metrics.items()
+                    if not np.isnan(values[i])
+                },
+            )
+            for i, k in enumerate(k_values)
+        }
+
+    def save(
+        self, key: str, results: Mapping[int, tuple[np.ndarray, Dict[str, float]]]
+    ):
+        """Store the labels and metrics of every cluster count of a sweep"""
+        if not results:
+            return
+        k_values = sorted(results)
+        labels = np.stack([results[k][0] for k in k_values])
+        labels = labels.astype(np.min_scalar_type(int(labels.max())))
+        metric_names = sorted({name for k in k_values for name in results[k][1]})
+        metrics = {
+            f"metric_{name}": np.array(
+                [results[k][1].get(name, np.nan) for k in k_values], dtype=np.float64
+            )
+            for name in metric_names
+        }
+        path = self._get_path(key)
+        tmp_file = path + ".tmp"
+        try:
+            with open(tmp_file, "wb") as f:
+                np.savez(f, k=np.array(k_values), labels=labels, **metrics)
+            os.replace(tmp_file, path)
+        except Exception as e:
+            logger.warning(f"Failed to save k sweep {key}: {e}")
+            return
+        self._evict()
+
+    def _evict(self):
+        """Remove the least recently used sweeps beyond the entry budget"""
+        paths = [
+            os.path.join(self.cache_dir, name)
+            for name in os.listdir(self.cache_dir)
+            if name.endswith(".npz")
+        ]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[self.max_entries :]:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Failed to remove k sweep {path}: {e}")
+
+    def clear(self):
+        """Remove all stored sweeps"""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+
+if __name__ == "__main__":
+    # Benchmark: size, load time and cluster assignments of the storage formats
+    # on the example data. Run from src_py with `python app_cache.py [model]`.
+    # "same" is the share of responses that keep their nearest reference
+    # center, which isolates the quantization from the seeding of a refit
+    import sys
+    import tempfile
+
+    from sentence_transformers import SentenceTransformer
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import adjusted_rand_score
+
+    from clusterer import DEFAULT_EMBEDDING_MODEL_NAME
+    from embedding import encode_texts
+    from ingestion import parse_input
+    from models import FileSettings
+
+    example_dir = os.path.join(os.path.dirname(__file__), "..", "example_data")
+    examples = {
+        "example.csv": FileSettings(
+            delimiter=";", has_header=True, selected_columns=list(range(1, 10))
+        ),
+        "quarantine-effects.csv": FileSettings(
+            delimiter=",", has_header=True, selected_columns=[2]
+        ),
+        "covid-parenting-challenges.csv": FileSettings(
+            delimiter=";", has_header=True, selected_columns=[0]
+        ),
+        "covid-parenting-rewards.csv": FileSettings(
+            delimiter=";", has_header=True, selected_columns=[0]
+        ),
+    }
+    cluster_count = 10
+    model = SentenceTransformer(
+        sys.argv[1] if len(sys.argv) > 1 else DEFAULT_EMBEDDING_MODEL_NAME
+    )
+
+    print(
+        f"{'file':<32} {'dtype':>8} {'bytes':>10} {'load ms':>8} {'min cos':>8} {'ARI':>6} {'same':>6}"
+    )
+    for file_name, file_settings in examples.items():
+        texts = parse_input(
+            os.path.join(example_dir, file_name), file_settings
+        ).responses
+        embeddings = encode_texts(model, texts)
+        keys = get_text_keys(texts)
+        reference_kmeans = KMeans(n_clusters=cluster_count, random_state=0).fit(
+            embeddings
+        )
+        reference = reference_kmeans.labels_
+        for storage_dtype in STORAGE_DTYPES:
+            with tempfile.TemporaryDirectory() as directory:
+                store = _ColumnarStore(directory, storage_dtype)
+                store.write_shard(keys, embeddings)
+                store.compact()
+                store.close()
+                size = sum(
+                    os.path.getsize(os.path.join(directory, name))
+                    for name in os.listdir(directory)
+                    if os.path.isfile(os.path.join(directory, name))
+                )
+                start = time.perf_counter()
+                store = _ColumnarStore(directory, storage_dtype)
+                found, loaded = store.lookup(keys)
+                load_time = time.perf_counter() - start
+                store.close()
+            assert found.all()
+            labels = KMeans(n_clusters=cluster_count, random_state=0).fit_predict(
+                loaded
+            )
+            min_cosine = float(np.min(np.sum(loaded * embeddings, axis=1)))
+            same = float(np.mean(reference_kmeans.predict(loaded) == reference))
+            print(
+                f"{file_name:<32} {storage_dtype:>8} {size:>10} {load_time * 1000:>8.1f} {min_cosine:>8.5f} {adjusted_rand_score(reference, labels):>6.3f} {same:>6.4f}"
+            )
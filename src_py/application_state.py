@@ -10,6 +10,13 @@ DEBUG_RUN_ID = ""
 DETERMINISTIC = False
 
 
+def _get_fit_settings(algorithm_settings: AlgorithmSettings) -> dict:
+    """Settings without those that only change how cluster counts are searched and scored"""
+    return algorithm_settings.model_dump(
+        exclude={"advanced_settings": {"kselection_metrics", "kselection_search"}}
+    )
+
+
 class ApplicationState:
     def __init__(self):
         logger.debug("Initializing ApplicationState")
@@ -39,9 +46,20 @@ class ApplicationState:
         return self.file_settings
 
     def set_algorithm_settings(self, algorithm_settings: AlgorithmSettings):
+        previous_settings = self.algorithm_settings
         self.algorithm_settings = algorithm_settings
         if DETERMINISTIC and not is_production_environment():
             self.random_state = 42
+        elif (
+            algorithm_settings.random_state is None
+            and previous_settings is not None
+            and previous_settings != algorithm_settings
+            and _get_fit_settings(previous_settings)
+            == _get_fit_settings(algorithm_settings)
+        ):
+            # Same fits as the previous run, so the stored k sweep can be re-scored.
+            # An identical rerun draws a new state like any other run.
+            logger.debug("Keeping the random state, only the k selection changed")
         else:
             self.random_state = algorithm_settings.random_state or random.randint(
                 1, 1000
@@ -0,0 +1,143 @@
+import time
+from typing import Optional
+
+import numpy as np
+from loguru import logger
+from sentence_transformers import SentenceTransformer
+
+from app_cache import EmbeddingCache, MemoryEmbeddingCache
+from embedding import EmbeddingProgress, encode_texts, get_cache_key
+from model_pool import EmbeddingModelPool
+from models import AdvancedSettings
+
+
+class CachedEmbedder:
+    """
+    Resolves the embeddings of texts through the cache tiers and the model.
+
+    Texts are looked up in the memory tier first and its misses on disk.
+    Vectors found on disk are promoted to the memory tier, and texts found
+    in neither are embedded and added to both. The clustering run and the
+    embedding precompute both go through this class, so they look up, embed
+    and cache in the same way.
+    """
+
+    def __init__(
+        self,
+        embedding_cache: EmbeddingCache,
+        memory_cache: MemoryEmbeddingCache,
+        model_pool: EmbeddingModelPool,
+        model_name: str,
+        advanced_settings: AdvancedSettings,
+        use_cache: bool = True,
+    ):
+        self.embedding_cache = embedding_cache
+        self.memory_cache = memory_cache
+        self.model_pool = model_pool
+        self.model_name = model_name
+        self.advanced_settings = advanced_settings
+        self.use_cache = use_cache
+        # Cache lookups made through this embedder
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "lookup_seconds": 0.0,
+        }
+
+    @property
+    def cache_key(self) -> str:
+        """Name the embeddings of the model and length limit are cached under"""
+        return get_cache_key(
+            self.model_name, self.advanced_settings.embedding_max_seq_length
+        )
+
+    def lookup(self, texts: list[str]) -> dict[str, Optional[np.ndarray]]:
+        """Look up embeddings in the memory tier, then its misses on disk"""
+        if not self.use_cache:
+            self.stats["misses"] += len(texts)
+            return {text: None for text in texts}
+        start_time = time.time()
+        disk_embeddings = {}
+        cached_embeddings_dict = self.memory_cache.get_embeddings(
+            self.cache_key, texts
+        )
+        memory_misses = [text for text in texts if cached_embeddings_dict[text] is None]
+        if memory_misses:
+            disk_embeddings = {
+                text: embedding
+                for text, embedding in self.embedding_cache.get_embeddings(
+                    self.cache_key, memory_misses
+                ).items()
+                if embedding is not None
+            }
+            self.memory_cache.save_embeddings(self.cache_key, disk_embeddings)
+            cached_embeddings_dict.update(disk_embeddings)
+        logger.debug(f"Found {len(texts) - len(memory_misses)} embeddings in memory")
+        self.stats["memory_hits"] += len(texts) - len(memory_misses)
+        self.stats["disk_hits"] += len(disk_embeddings)
+        self.stats["misses"] += len(memory_misses) - len(disk_embeddings)
+        self.stats["lookup_seconds"] += time.time() - start_time
+        return cached_embeddings_dict
+
+    def embed(
+        self,
+        texts_to_embed: list[str],
+        embedding_model: SentenceTransformer,
+        progress: EmbeddingProgress,
+    ) -> dict[str, np.ndarray]:
+        """Embed texts that are not cached yet and add them to the caches"""
+        process_pool = None
+        if (
+            self.advanced_settings.embedding_workers > 1
+            and embedding_model.device.type == "cpu"
+        ):
+            try:
+                process_pool = self.model_pool.get_process_pool(
+                    self.model_name, self.advanced_settings.embedding_workers
+                )
+            except Exception as e:
+                logger.warning(
+                    f"Failed to start embedding workers, embedding in-process: {e}"
+                )
+        new_embeddings = encode_texts(
+            # [f"query: {text}" for text in texts_to_embed]
+            embedding_model,
+            texts_to_embed,
+            batch_size=self.advanced_settings.embedding_batch_size,
+            max_seq_length=self.advanced_settings.embedding_max_seq_length,
+            on_batch=progress.update,
+            process_pool=process_pool,
+        )
+
+        # Create a dictionary of new embeddings
+        new_embeddings_dict = {
+            text: new_embeddings[i] for i, text in enumerate(texts_to_embed)
+        }
+
+        # Save the new embeddings to the cache
+        if self.use_cache:
+            self.embedding_cache.save_embeddings(self.cache_key, new_embeddings_dict)
+            self.memory_cache.save_embeddings(self.cache_key, new_embeddings_dict)
+        return new_embeddings_dict
+
+    def get_embeddings(
+        self,
+        texts: list[str],
+        embedding_model: SentenceTransformer,
+        progress: EmbeddingProgress,
+    ) -> dict[str, np.ndarray]:
+        """
+        Embeddings of all texts, embedding the ones that are not cached.
+        The total of `progress` grows by the number of texts embedded.
+        """
+        embeddings = self.lookup(texts)
+        texts_to_embed = [text for text in texts if embeddings[text] is None]
+        if texts_to_embed:
+            progress.total += len(texts_to_embed)
+            embeddings.update(self.embed(texts_to_embed, embedding_model, progress))
+        return {
+            text: embedding
+            for text, embedding in embeddings.items()
+            if embedding is not None
+        }
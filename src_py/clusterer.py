@@ -1,24 +1,19 @@
-import csv
 import os
+import queue
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
 import numpy as np
 
 
-from alt_clustering.spherical_k_means import SphericalKMeans
-from sklearn.cluster import AgglomerativeClustering, KMeans
+from sklearn.cluster import AgglomerativeClustering
 from sklearn.manifold import TSNE
 from sklearn.decomposition import PCA
-from sklearn.metrics import (
-    silhouette_score,
-    calinski_harabasz_score,
-    davies_bouldin_score,
-)
 from utils.ipc import print_progress
 from matplotlib import pyplot as plt
 from sentence_transformers import SentenceTransformer
 from application_state import ApplicationState
 from loguru import logger
-from collections import Counter
 from models import (
     Cluster,
     KSelectionStatistic,
@@ -33,14 +28,36 @@ from models import (
     Timesteps,
     ClusteringResult,
 )
-from utils.utils import preprocess_response
-from app_cache import EmbeddingCache
+from ingestion import ParsedInputCache
+from utils.matching import ExcludedWordsMatcher
+from app_cache import EmbeddingCache, KSweepCache, MemoryEmbeddingCache
+from model_pool import EmbeddingModelPool
+from neighbors import (
+    APPROXIMATE_SEARCH_MIN_SIZE,
+    IVFIndex,
+    approximate_average_neighbor_similarity,
+    average_neighbor_similarity,
+)
+from k_selection import KSweep, make_kmeans, normalize_scores, search_k
+from embedding import EmbeddingProgress
+from cached_embedding import CachedEmbedder
 
 DEFAULT_EMBEDDING_MODEL_NAME = "intfloat/multilingual-e5-large-instruct"
+# In pipelined mode, texts are handed to the embedding thread in groups of this
+# many embedding batches, so that they can still be bucketed by length
+PIPELINE_BATCHES_PER_GROUP = 16
 
 
 class Clusterer:
-    def __init__(self, app_state: ApplicationState):
+    def __init__(
+        self,
+        app_state: ApplicationState,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        memory_cache: Optional[MemoryEmbeddingCache] = None,
+        model_pool: Optional[EmbeddingModelPool] = None,
+        parsed_input_cache: Optional[ParsedInputCache] = None,
+        k_sweep_cache: Optional[KSweepCache] = None,
+    ):
         file_path = app_state.get_file_path()
         file_settings = app_state.get_file_settings()
         algorithm_settings = app_state.get_algorithm_settings()
@@ -51,6 +68,8 @@ class Clusterer:
         self.algorithm_settings = algorithm_settings
 
         self.timesteps = Timesteps(steps={})
+        # Built from the run's embeddings when an approximate search is requested
+        self.neighbor_index: Optional[IVFIndex] = None
         self._random_state = app_state.get_random_state()
         logger.debug(f"Random state: {self._random_state}")
 
@@ -64,13 +83,26 @@ class Clusterer:
         else:
             self.embedding_model_name = DEFAULT_EMBEDDING_MODEL_NAME
 
-        # Initialize the embedding cache
-        self.embedding_cache = EmbeddingCache()
+        # The controller shares its caches across runs, standalone use gets its own
+        self.embedding_cache = embedding_cache or EmbeddingCache()
+        self.memory_cache = memory_cache or MemoryEmbeddingCache()
+        self.model_pool = model_pool or EmbeddingModelPool()
+        self.parsed_input_cache = parsed_input_cache or ParsedInputCache()
+        self.k_sweep_cache = k_sweep_cache or KSweepCache()
         self.use_cache = True
         if not self.use_cache:
             logger.warning(
                 "Embedding cache is disabled. This may slow down the clustering process."
             )
+        # Its lookups of this run are stored with the timesteps
+        self.embedder = CachedEmbedder(
+            self.embedding_cache,
+            self.memory_cache,
+            self.model_pool,
+            self.embedding_model_name,
+            algorithm_settings.advanced_settings,
+            self.use_cache,
+        )
 
         print_progress("process_input_file", "todo")
         print_progress("load_model", "todo")
@@ -87,42 +119,18 @@ class Clusterer:
     def get_random_state(self):
         return self._random_state
 
+    @property
+    def embedding_cache_key(self) -> str:
+        """Name the embeddings of the model and length limit are cached under"""
+        return self.embedder.cache_key
+
     def process_input_file(self, excluded_words: list[str]):
         print_progress("process_input_file", "start")
-        response_counter: Counter[str] = Counter()
         try:
-            with open(self.file_path, encoding="utf-8") as f:
-                reader = csv.reader(f, delimiter=self.file_settings.delimiter)
-                if self.file_settings.has_header:
-                    reader.__next__()
-
-                for row in reader:
-                    for column_index in self.file_settings.selected_columns:
-                        if column_index >= len(row):
-                            logger.warning(
-                                f"Skipping invalid column {column_index} in row {reader.line_num}"
-                            )
-                            continue
-                        # get the next entry provided by the current participant
-                        response = preprocess_response(row[column_index])
-                        if response == "" or response is None:
-                            continue
-                        for excluded_word in excluded_words:
-                            if (
-                                response == excluded_word
-                                or f" {excluded_word}" in response
-                                or f"{excluded_word} " in response
-                            ):
-                                logger.info(
-                                    f"Excluded word found: {excluded_word} in response: {response}"
-                                )
-
-                                # skip the response if it contains an excluded word
-                                break
-                        else:
-                            # if the response is not an excluded word, count it
-                            response_counter[response] += 1
-            responses = list(response_counter.keys())
+            parsed_input = self.parsed_input_cache.get(
+                self.file_path, self.file_settings
+            )
+            response_counter = parsed_input.count_responses(excluded_words)
             responses = [
                 Response(text=response, count=count)
                 for response, count in response_counter.items()
@@ -138,7 +146,7 @@ class Clusterer:
     def load_embedding_model(self, model_name: str):
         print_progress("load_model", "start")
         try:
-            model = SentenceTransformer(model_name)
+            model = self.model_pool.get(model_name)
             print_progress("load_model", "complete")
             self.timesteps.steps["load_model"] = time.time()
             return model
@@ -147,69 +155,147 @@ class Clusterer:
             logger.error(f"Error loading embedding model: {e}")
             raise
 
+    def record_cache_stats(self):
+        """Store the cache hit rate of the run with its timesteps"""
+        cache_stats = self.embedder.stats
+        lookups = sum(
+            cache_stats[name] for name in ("memory_hits", "disk_hits", "misses")
+        )
+        hit_rate = (lookups - cache_stats["misses"]) / lookups if lookups else 0.0
+        self.timesteps.cache_stats = {**cache_stats, "hit_rate": hit_rate}
+        logger.info(
+            f"Embedding cache hit rate {hit_rate:.1%} ({cache_stats['memory_hits']} in memory, {cache_stats['disk_hits']} on disk, {cache_stats['misses']} misses)"
+        )
+
     def embed_responses(
         self, responses: list[Response], embedding_model: SentenceTransformer
     ):
         print_progress("embed_responses", "start")
 
-        # Get the list of texts to embed
+        # Embed only the texts that aren't in the cache
         texts = [response.text for response in responses]
-
-        # Try to get embeddings from cache first
-        cached_embeddings = self.embedding_cache.get_embeddings(
-            self.embedding_model_name, texts
-        )
-
-        # Convert to a mutable dictionary since Mapping doesn't support __setitem__
-        if self.use_cache:
-            cached_embeddings_dict = dict(cached_embeddings)
+        progress = EmbeddingProgress("embed_responses", 0)
+        embeddings_map = self.embedder.get_embeddings(texts, embedding_model, progress)
+        if progress.total:
+            logger.info(
+                f"Embedded {progress.total} texts (found {len(texts) - progress.total} in cache)"
+            )
         else:
-            cached_embeddings_dict = {text: None for text in texts}
+            logger.info(f"All {len(texts)} texts found in cache")
 
-        # Identify which texts need to be embedded
-        texts_to_embed = [
-            text for text in texts if cached_embeddings_dict[text] is None
-        ]
+        self.record_cache_stats()
+        print_progress("embed_responses", "complete")
+        self.timesteps.steps["embed_responses"] = time.time()
+        return embeddings_map
 
-        if texts_to_embed:
-            logger.info(
-                f"Embedding {len(texts_to_embed)} texts (found {len(texts) - len(texts_to_embed)} in cache)"
+    def process_and_embed_responses(
+        self, excluded_words: list[str]
+    ) -> tuple[list[Response], dict[str, np.ndarray]]:
+        """
+        Pipelined form of `process_input_file`, `load_embedding_model` and
+        `embed_responses`.
+
+        The model is loaded in the background while the input file is parsed.
+        Unique responses are handed to an embedding thread in groups as soon
+        as they are found, and every group is looked up in the caches on its
+        own, so the stages overlap instead of running one after the other.
+        """
+        matcher = ExcludedWordsMatcher(excluded_words)
+        group_size = (
+            self.algorithm_settings.advanced_settings.embedding_batch_size
+            * PIPELINE_BATCHES_PER_GROUP
+        )
+        groups: queue.Queue[Optional[list[str]]] = queue.Queue()
+        embeddings: dict[str, np.ndarray] = {}
+
+        with ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="clusterer-pipeline"
+        ) as executor:
+            model_future = executor.submit(
+                self.load_embedding_model, self.embedding_model_name
             )
-            # Embed only the texts that weren't in the cache
-            new_embeddings = embedding_model.encode(
-                # [f"query: {text}" for text in texts_to_embed], normalize_embeddings=True
-                texts_to_embed,
-                normalize_embeddings=True,
+            embed_future = executor.submit(
+                self._embed_groups, model_future, groups, embeddings
             )
-
-            # Create a dictionary of new embeddings
-            new_embeddings_dict = {
-                text: new_embeddings[i] for i, text in enumerate(texts_to_embed)
-            }
-
-            # Save the new embeddings to the cache
-            if self.use_cache:
-                self.embedding_cache.save_embeddings(
-                    self.embedding_model_name, new_embeddings_dict
+            try:
+                responses = self._stream_input_file(
+                    excluded_words, matcher, groups, group_size
                 )
+            finally:
+                groups.put(None)
+            try:
+                embed_future.result()
+            finally:
+                if model_future.exception() is None:
+                    self.model_pool.release(self.embedding_model_name)
 
-            # Update the cached embeddings with the new ones
-            # TODO: This is a hack to get the embeddings map to work
-            for text, embedding in new_embeddings_dict.items():
-                cached_embeddings_dict[text] = embedding
-        else:
-            logger.info(f"All {len(texts)} texts found in cache")
-
-        # Create the final embeddings map
         embeddings_map = {
-            text: embedding
-            for text, embedding in cached_embeddings_dict.items()
-            if embedding is not None
+            response.text: embeddings[response.text]
+            for response in responses
+            if response.text in embeddings
         }
+        return responses, embeddings_map
+
+    def _stream_input_file(
+        self,
+        excluded_words: list[str],
+        matcher: ExcludedWordsMatcher,
+        groups: queue.Queue[Optional[list[str]]],
+        group_size: int,
+    ) -> list[Response]:
+        print_progress("process_input_file", "start")
+        try:
+            pending: list[str] = []
+            for new_responses in self.parsed_input_cache.iter_new_responses(
+                self.file_path, self.file_settings
+            ):
+                pending.extend(
+                    response
+                    for response in new_responses
+                    if not matcher or not matcher.is_excluded(response)
+                )
+                while len(pending) >= group_size:
+                    groups.put(pending[:group_size])
+                    pending = pending[group_size:]
+            if pending:
+                groups.put(pending)
+
+            parsed_input = self.parsed_input_cache.get(
+                self.file_path, self.file_settings
+            )
+            response_counter = parsed_input.count_responses(excluded_words)
+            responses = [
+                Response(text=response, count=count)
+                for response, count in response_counter.items()
+            ]
+            print_progress("process_input_file", "complete")
+            self.timesteps.steps["process_input_file"] = time.time()
+            return responses
+        except Exception as e:
+            print_progress("process_input_file", "error")
+            logger.error(f"Error reading file: {e}")
+            return []
 
+    def _embed_groups(
+        self,
+        model_future: Future[SentenceTransformer],
+        groups: queue.Queue[Optional[list[str]]],
+        embeddings: dict[str, np.ndarray],
+    ):
+        embedding_model = model_future.result()
+        print_progress("embed_responses", "start")
+        # The total grows as uncached texts are discovered
+        progress = EmbeddingProgress("embed_responses", 0)
+        while (group := groups.get()) is not None:
+            embeddings.update(
+                self.embedder.get_embeddings(group, embedding_model, progress)
+            )
+        logger.info(
+            f"Embedded {progress.total} texts (found {len(embeddings) - progress.total} in cache)"
+        )
+        self.record_cache_stats()
         print_progress("embed_responses", "complete")
         self.timesteps.steps["embed_responses"] = time.time()
-        return embeddings_map
 
     def detect_outliers(
         self,
@@ -217,6 +303,8 @@ class Clusterer:
         embeddings: np.ndarray,
         outlier_k: int,
         z_score_threshold: float,
+        neighbor_search: str = "exact",
+        nprobe: Optional[int] = None,
     ):
         print_progress("detect_outliers", "start")
         # Potential for visualization: plot the distribution of average neighbor similarities
@@ -227,15 +315,18 @@ class Clusterer:
             return OutlierStatistics(threshold=0.0, outliers=[])
         if outlier_k >= len(responses) - 1:
             outlier_k = len(responses) - 2
-        similarity_matrix = np.dot(embeddings, embeddings.T)
-        partition = np.partition(-similarity_matrix, outlier_k + 1, axis=1)
-        sorted_neighborhood_partition = np.copy(partition)
-        sorted_neighborhood_partition[:, : outlier_k + 1] = np.sort(
-            partition[:, : outlier_k + 1], axis=1
-        )
-        avg_neighbor_sim = np.mean(
-            -sorted_neighborhood_partition[:, 1 : outlier_k + 1], axis=1
-        )
+        if (
+            neighbor_search == "approximate"
+            and len(embeddings) >= APPROXIMATE_SEARCH_MIN_SIZE
+        ):
+            self.neighbor_index = IVFIndex(
+                embeddings, nprobe=nprobe, random_state=self._random_state
+            )
+            avg_neighbor_sim = approximate_average_neighbor_similarity(
+                self.neighbor_index, embeddings, outlier_k
+            )
+        else:
+            avg_neighbor_sim = average_neighbor_similarity(embeddings, outlier_k)
 
         outlier_threshold = np.mean(avg_neighbor_sim) - z_score_threshold * np.std(
             avg_neighbor_sim
@@ -297,104 +388,84 @@ class Clusterer:
             )
             max_clusters = len(embeddings)
 
-        use_silhouette_scores, silhouette_weight = False, 0.0
-        use_ch_scores, ch_weight = False, 0.0
-        use_db_scores, db_weight = False, 0.0
-
-        for metric in self.algorithm_settings.advanced_settings.kselection_metrics:
-            if metric.name == "silhouette":
-                use_silhouette_scores = True
-                silhouette_weight = metric.weight
-            elif metric.name == "calinski_harabasz":
-                use_ch_scores = True
-                ch_weight = metric.weight
-            elif metric.name == "davies_bouldin":
-                use_db_scores = True
-                db_weight = metric.weight
-
-        # Calculate metrics for each cluster count
-        silhouttes: list[float] = []
-        ch_scores: list[float] = []
-        db_scores: list[float] = []
-        k_values = [k for k in range(min_clusters, max_clusters + 1)]
-        for k in k_values:
-            # Fit K-means with sample weights
-            if (
-                self.algorithm_settings.advanced_settings.kmeans_method
-                == "spherical_kmeans"
-            ):
-                kmeans = SphericalKMeans(n_clusters=k, random_state=self._random_state)
-            else:
-                kmeans = KMeans(
-                    n_clusters=k, n_init="auto", random_state=self._random_state
-                )
-            kmeans.fit(embeddings, sample_weight=weights)
-            labels = kmeans.labels_
-
-            if use_silhouette_scores:
-                silhouette_avg = silhouette_score(
-                    X=embeddings, labels=labels, random_state=self._random_state
-                )
-                silhouttes.append(float(silhouette_avg))
-
-            if use_ch_scores:
-                ch_score = calinski_harabasz_score(X=embeddings, labels=labels)
-                ch_scores.append(ch_score)
-
-            if use_db_scores:
-                db_score = davies_bouldin_score(X=embeddings, labels=labels)
-                db_scores.append(db_score)
-
-        # Plot the metrics
-        plt.figure(figsize=(10, 6))
+        advanced_settings = self.algorithm_settings.advanced_settings
+        metric_weights = {
+            metric.name: metric.weight for metric in advanced_settings.kselection_metrics
+        }
 
-        combined_scores = np.zeros(len(k_values))
-        metric_count = 0
-        # Normalize scores for comparison
-        if use_silhouette_scores:
-            silhouttes_normalized: np.ndarray = (silhouttes - np.min(silhouttes)) / (
-                np.max(silhouttes) - np.min(silhouttes)
+        # Calculate metrics for the cluster counts the search needs. Counts
+        # that an earlier sweep with the same fits evaluated are only re-scored.
+        # Cold fits only depend on their cluster count. A warm fit depends on
+        # the chain of fits before it, which is fixed by the range for an
+        # exhaustive search, but follows the scores for the other searches
+        warm_start = advanced_settings.kselection_sweep == "warm_start"
+        if not warm_start:
+            sweep_key = KSweepCache.get_key(
+                embeddings,
+                weights,
+                kmeans_method=advanced_settings.kmeans_method,
+                random_state=self._random_state,
+                sweep=advanced_settings.kselection_sweep,
             )
-            combined_scores += silhouttes_normalized * silhouette_weight
-            metric_count += 1
-            plt.plot(
-                k_values, silhouttes_normalized, "b-", label="Normalized Silhouette"
+        elif advanced_settings.kselection_search == "exhaustive":
+            sweep_key = KSweepCache.get_key(
+                embeddings,
+                weights,
+                kmeans_method=advanced_settings.kmeans_method,
+                random_state=self._random_state,
+                sweep=advanced_settings.kselection_sweep,
+                search=advanced_settings.kselection_search,
+                min_clusters=min_clusters,
+                max_clusters=max_clusters,
             )
         else:
-            silhouttes_normalized = np.zeros(len(k_values))
-
-        if use_ch_scores:
-            ch_scores_normalized = (ch_scores - np.min(ch_scores)) / (
-                np.max(ch_scores) - np.min(ch_scores)
-            )
-            combined_scores += ch_scores_normalized * ch_weight
-            metric_count += 1
-            plt.plot(
-                k_values,
-                ch_scores_normalized,
-                "g-",
-                label="Normalized Calinski-Harabasz",
+            sweep_key = None
+        cached_results = self.k_sweep_cache.load(sweep_key) if sweep_key else {}
+        with KSweep(
+            embeddings,
+            weights,
+            advanced_settings.kmeans_method,
+            set(metric_weights),
+            self._random_state,
+            workers=advanced_settings.kselection_workers,
+            warm_start=warm_start,
+            cached_results=cached_results,
+        ) as sweep:
+            search_k(
+                sweep,
+                min_clusters,
+                max_clusters,
+                advanced_settings.kselection_search,
+                metric_weights,
             )
-        else:
-            ch_scores_normalized = np.zeros(len(k_values))
+        if sweep_key:
+            self.k_sweep_cache.save(sweep_key, {**cached_results, **sweep.results})
+        evaluated_k_values = sorted(sweep.scores)
+        normalized_scores, evaluated_combined_scores = normalize_scores(
+            [sweep.scores[k] for k in evaluated_k_values], metric_weights
+        )
+        optimal_k = evaluated_k_values[np.argmax(evaluated_combined_scores)]
+        # The final clustering reuses the sweep's model of the optimal count
+        optimal_fit = sweep.get_fit(optimal_k)
 
-        if use_db_scores:
-            db_scores_normalized = 1 - (db_scores - np.min(db_scores)) / (
-                np.max(db_scores) - np.min(db_scores)
-            )
-            combined_scores += db_scores_normalized * db_weight
-            metric_count += 1
+        # Plot the metrics
+        plt.figure(figsize=(10, 6))
+        for name, style, label in [
+            ("silhouette", "b-", "Normalized Silhouette"),
+            ("calinski_harabasz", "g-", "Normalized Calinski-Harabasz"),
+            ("davies_bouldin", "y-", "Normalized Davies-Bouldin"),
+        ]:
+            if name in normalized_scores:
+                plt.plot(
+                    evaluated_k_values, normalized_scores[name], style, label=label
+                )
+        if len(normalized_scores) > 1:
             plt.plot(
-                k_values, db_scores_normalized, "y-", label="Normalized Davies-Bouldin"
+                evaluated_k_values,
+                evaluated_combined_scores,
+                "r-",
+                label="Combined Score",
             )
-        else:
-            db_scores_normalized = np.zeros(len(k_values))
-
-        combined_scores /= metric_count
-        optimal_k = k_values[np.argmax(combined_scores)]
-
-        if metric_count > 1:
-            plt.plot(k_values, combined_scores, "r-", label="Combined Score")
         plt.xlabel("Number of Clusters (K)")
         plt.ylabel("Score")
         plt.title("Cluster Count Selection Metrics")
@@ -403,17 +474,29 @@ class Clusterer:
         plt.savefig(f"{self.result_dir}/cluster_count_selection_metrics.png")
         plt.close()
 
-        logger.debug(f"Optimal K: {optimal_k}")
+        logger.debug(
+            f"Optimal K: {optimal_k} ({len(evaluated_k_values)} of {max_clusters - min_clusters + 1} cluster counts evaluated)"
+        )
 
+        # Counts the search skipped are listed without scores
+        evaluated_indices = {k: i for i, k in enumerate(evaluated_k_values)}
         selection_stats: list[KSelectionStatistic] = []
-        for i, k in enumerate(k_values):
+        for k in range(min_clusters, max_clusters + 1):
+            index = evaluated_indices.get(k)
+            metrics = {
+                name: values[index] if index is not None else None
+                for name, values in normalized_scores.items()
+            }
             selection_stats.append(
                 KSelectionStatistic(
                     k=k,
-                    silhouette=silhouttes_normalized[i] if silhouttes else None,
-                    calinski_harabasz=ch_scores_normalized[i] if ch_scores else None,
-                    davies_bouldin=db_scores_normalized[i] if db_scores else None,
-                    combined=combined_scores[i],
+                    silhouette=metrics.get("silhouette"),
+                    calinski_harabasz=metrics.get("calinski_harabasz"),
+                    davies_bouldin=metrics.get("davies_bouldin"),
+                    combined=(
+                        evaluated_combined_scores[index] if index is not None else None
+                    ),
+                    evaluated=index is not None,
                 )
             )
 
@@ -421,7 +504,8 @@ class Clusterer:
         self.timesteps.steps["find_optimal_k"] = time.time()
         if not optimal_k:
             optimal_k = max_clusters
-        return optimal_k, selection_stats
+            optimal_fit = None
+        return optimal_k, selection_stats, optimal_fit
 
     def start_clustering(
         self,
@@ -430,7 +514,13 @@ class Clusterer:
         embeddings_map: dict[str, np.ndarray],
         K: int,
         response_weights: np.ndarray,
+        fit: Optional[tuple[np.ndarray, np.ndarray]] = None,
     ):
+        """
+        Assign the responses to K clusters. `fit` holds the labels and
+        centers of an existing k-means fit of the embeddings, which are used
+        instead of fitting again.
+        """
         print_progress("cluster", "start")
         if len(embeddings) < K:
             logger.warning(
@@ -438,26 +528,24 @@ class Clusterer:
             )
             K = len(embeddings) - 1
         # Side Effect: Assigns cluster IDs to responses
-        if (
-            self.algorithm_settings.advanced_settings.kmeans_method
-            == "spherical_kmeans"
-        ):
-            kmeans = SphericalKMeans(n_clusters=K, random_state=self._random_state).fit(
-                embeddings, sample_weight=response_weights
-            )
+        if fit is not None:
+            labels, centers = fit
+            K = len(centers)
         else:
-            kmeans = KMeans(
-                n_clusters=K, n_init="auto", random_state=self._random_state
-            )
-        clustering = kmeans.fit(embeddings, sample_weight=response_weights)
-        cluster_indices = np.copy(clustering.labels_)
+            clustering = make_kmeans(
+                K,
+                self.algorithm_settings.advanced_settings.kmeans_method,
+                self._random_state,
+            ).fit(embeddings, sample_weight=response_weights)
+            labels, centers = clustering.labels_, clustering.cluster_centers_
+        cluster_indices = np.copy(labels)
         valid_clusters = [i for i in range(K) if np.sum(cluster_indices == i) > 0]
         K = len(valid_clusters)
         cluster_indices = np.array(
             [valid_clusters.index(idx) for idx in cluster_indices]
         )
-        cluster_centers = clustering.cluster_centers_ / np.linalg.norm(
-            clustering.cluster_centers_, axis=1, keepdims=True, ord=2
+        cluster_centers = centers[valid_clusters] / np.linalg.norm(
+            centers[valid_clusters], axis=1, keepdims=True, ord=2
         )
 
         clusters = []
@@ -617,11 +705,19 @@ class Clusterer:
         logger.error
         print_progress("start", "start")
         self.timesteps.steps["start"] = time.time()
-        responses = self.process_input_file(self.algorithm_settings.excluded_words)
-
-        embedding_model = self.load_embedding_model(self.embedding_model_name)
-
-        embeddings_map = self.embed_responses(responses, embedding_model)
+        if self.algorithm_settings.advanced_settings.pipelined_embedding:
+            responses, embeddings_map = self.process_and_embed_responses(
+                self.algorithm_settings.excluded_words
+            )
+        else:
+            responses = self.process_input_file(
+                self.algorithm_settings.excluded_words
+            )
+            embedding_model = self.load_embedding_model(self.embedding_model_name)
+            try:
+                embeddings_map = self.embed_responses(responses, embedding_model)
+            finally:
+                self.model_pool.release(self.embedding_model_name)
         original_embeddings_map = embeddings_map.copy()
         embeddings = np.asarray(list(embeddings_map.values()))
 
@@ -631,6 +727,8 @@ class Clusterer:
                 embeddings,
                 outlier_k=self.algorithm_settings.outlier_detection.nearest_neighbors,
                 z_score_threshold=self.algorithm_settings.outlier_detection.z_score_threshold,
+                neighbor_search=self.algorithm_settings.outlier_detection.neighbor_search,
+                nprobe=self.algorithm_settings.outlier_detection.nprobe,
             )
             # Update responses to exclude outliers
             responses = [response for response in responses if not response.is_outlier]
@@ -644,13 +742,16 @@ class Clusterer:
         response_weights = np.array([response.count for response in responses])
 
         if self.algorithm_settings.method.cluster_count_method == "auto":
-            K, selection_stats = self.find_optimal_k(embeddings, response_weights)
+            K, selection_stats, fit = self.find_optimal_k(
+                embeddings, response_weights
+            )
         else:
             K = self.algorithm_settings.method.cluster_count
             selection_stats = []
+            fit = None
 
         clusters = self.start_clustering(
-            responses, embeddings, embeddings_map, K, response_weights
+            responses, embeddings, embeddings_map, K, response_weights, fit
         )
 
         if self.algorithm_settings.agglomerative_clustering:
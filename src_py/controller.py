@@ -1,14 +1,14 @@
-import csv
+import multiprocessing
 import sys
 import traceback
 import uuid
 from pydantic import ValidationError
 from utils.logging import initialize_logger
-from utils.utils import preprocess_response
 from models import (
     AdvancedSettings,
     AutomaticClusterCount,
     AvailableModelsMessage,
+    CacheStatsMessage,
     CachedModelsMessage,
     ClusterPositionDetail,
     ClusterPositionsMessage,
@@ -37,9 +37,12 @@ from utils.ipc import print_message, print_progress
 from loguru import logger
 from application_state import ApplicationState
 from database_manager import DatabaseManager
-from clusterer import Clusterer
-from app_cache import EmbeddingCache
+from clusterer import DEFAULT_EMBEDDING_MODEL_NAME, Clusterer
+from app_cache import EmbeddingCache, KSweepCache, MemoryEmbeddingCache
 from downloader import DownloadManager
+from model_pool import EmbeddingModelPool
+from ingestion import ParsedInputCache
+from precompute import EmbeddingPrecomputer
 
 
 class Controller:
@@ -50,31 +53,27 @@ class Controller:
         self.download_manager = DownloadManager()
         self.embedding_cache = EmbeddingCache()
         self.embedding_cache.clear_expired_caches()
+        self.embedding_cache.enforce_budget()
+        self.memory_cache = MemoryEmbeddingCache()
+        self.model_pool = EmbeddingModelPool()
+        self.parsed_input_cache = ParsedInputCache()
+        self.k_sweep_cache = KSweepCache()
+        self.embedding_precomputer = EmbeddingPrecomputer(
+            self.embedding_cache,
+            self.memory_cache,
+            self.model_pool,
+            self.parsed_input_cache,
+        )
 
         print_progress("init", "complete")
 
     def fetch_raw_responses(self):
         assert self.app_state.file_path is not None
         assert self.app_state.file_settings is not None
-        responses = []
-        with open(self.app_state.file_path, encoding="utf-8") as f:
-            reader = csv.reader(f, delimiter=self.app_state.file_settings.delimiter)
-            if self.app_state.file_settings.has_header:
-                reader.__next__()
-
-            for row in reader:
-                for column_index in self.app_state.file_settings.selected_columns:
-                    if column_index >= len(row):
-                        logger.warning(
-                            f"Skipping invalid column {column_index} in row {reader.line_num}"
-                        )
-                        continue
-                    # get the next entry provided by the current participant
-                    response = preprocess_response(row[column_index])
-                    if response == "" or response is None:
-                        continue
-                    responses.append(response)
-        return responses
+        parsed_input = self.parsed_input_cache.get(
+            self.app_state.file_path, self.app_state.file_settings
+        )
+        return parsed_input.raw_responses()
 
     def handle_command(self, command: Command):
         logger.info(f"Received command: {command}")
@@ -82,6 +81,7 @@ class Controller:
             if not command.data or not isinstance(command.data, FilePathPayload):
                 print_message("error", Error(error="File path cannot be empty"))
                 return
+            self.embedding_precomputer.cancel()
             self.app_state.set_file_path(command.data.file_path)
         elif command.action == "get_file_path":
             print_message("file_path", self.app_state.get_file_path())
@@ -109,7 +109,19 @@ class Controller:
                     return
                 run_id = uuid.uuid4()
                 self.app_state.set_run_id(run_id)
-                clusterer = Clusterer(self.app_state)
+                clusterer = Clusterer(
+                    self.app_state,
+                    embedding_cache=self.embedding_cache,
+                    memory_cache=self.memory_cache,
+                    model_pool=self.model_pool,
+                    parsed_input_cache=self.parsed_input_cache,
+                    k_sweep_cache=self.k_sweep_cache,
+                )
+                self.embedding_precomputer.finish(
+                    clusterer.file_path,
+                    clusterer.file_settings,
+                    clusterer.embedding_cache_key,
+                )
                 try:
                     result = clusterer.run()
                 except Exception as e:
@@ -117,6 +129,8 @@ class Controller:
                     logger.error(f"Error running clustering: {e}")
                     print_message("error", Error(error=str(e)))
                     raise
+                finally:
+                    self.embedding_cache.flush_stats()
                 algorithm_settings_dict = algorithm_settings.model_dump()
                 algorithm_settings_dict["random_state"] = (
                     self.app_state.get_random_state()
@@ -130,11 +144,32 @@ class Controller:
                     algorithm_settings=algorithm_settings.model_dump_json(),
                     result=result,
                 )
-                self.database_manager.create_output_file(run)
+                self.database_manager.create_output_file(
+                    run, self.parsed_input_cache
+                )
                 self.database_manager.create_assignments_file(run)
                 self.database_manager.save_run(session, run, result.timesteps)
                 print_progress("save", "complete")
 
+        elif command.action == "precompute_embeddings":
+            file_path = self.app_state.get_file_path()
+            file_settings = self.app_state.get_file_settings()
+            if not file_path or not file_settings:
+                print_message("error", Error(error="File settings not set"))
+                return
+            # Use the settings of the previous run if there was one
+            algorithm_settings = self.app_state.get_algorithm_settings()
+            advanced_settings = (
+                algorithm_settings.advanced_settings
+                if algorithm_settings
+                else AdvancedSettings()
+            )
+            self.embedding_precomputer.start(
+                file_path,
+                file_settings,
+                advanced_settings.embedding_model or DEFAULT_EMBEDDING_MODEL_NAME,
+                advanced_settings,
+            )
         elif command.action == "set_run_id":
             if not command.data or not isinstance(command.data, RunIdPayload):
                 print_message("error", Error(error="Run ID cannot be empty"))
@@ -423,6 +458,19 @@ class Controller:
                 AvailableModelsMessage(models=[model for model in models]),
             )
 
+        elif command.action == "get_cache_stats":
+            print_message(
+                "cache_stats",
+                CacheStatsMessage(
+                    models=[
+                        CacheStatsMessage.ModelCacheStats(**stats)
+                        for stats in self.embedding_cache.get_stats()
+                    ],
+                    memory_entries=len(self.memory_cache),
+                    memory_bytes=self.memory_cache.size,
+                ),
+            )
+
         elif command.action == "fetch_raw_responses":
             responses = self.fetch_raw_responses()
             print_message("raw_responses", RawResponsesMessage(responses=responses))
@@ -448,6 +496,8 @@ def main():
 
 
 if __name__ == "__main__":
+    # Required for the ingestion worker processes in the bundled app
+    multiprocessing.freeze_support()
     DEBUG = False
     if DEBUG:
         print("Running in debug mode")
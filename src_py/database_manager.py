@@ -1,8 +1,11 @@
 import csv
 import time
 import uuid
+from typing import Optional
+import numpy as np
 from loguru import logger
 from sqlmodel import create_engine, SQLModel, Session, select
+from ingestion import ParsedInputCache
 from models import (
     AlgorithmSettings,
     Cluster,
@@ -14,7 +17,7 @@ from models import (
     Timesteps,
 )
 import os
-from utils.utils import get_user_data_path, preprocess_response
+from utils.utils import get_user_data_path
 from utils.ipc import print_progress
 
 
@@ -134,48 +137,53 @@ class DatabaseManager:
         session.add(cluster)
         session.commit()
 
-    def create_output_file(self, run: Run):
+    def create_output_file(
+        self, run: Run, parsed_input_cache: Optional[ParsedInputCache] = None
+    ):
         if not run.result:
             raise ValueError("Run result is empty")
 
         file_settings = FileSettings.model_validate_json(run.file_settings)
+        # The run has usually parsed the file already, reuse its response mapping
+        parsed_input = (parsed_input_cache or ParsedInputCache()).get(
+            run.file_path, file_settings
+        )
 
-        responses = run.result.get_all_responses()
-        response_text_map = {response.text: response for response in responses}
-        rows = []
-        with open(run.file_path, "r", encoding="utf-8") as f:
-            reader = csv.reader(f, delimiter=file_settings.delimiter)
-            if file_settings.has_header:
-                header = next(reader)
-                rows.append(header)
-            for row in reader:
-                for i in file_settings.selected_columns:
-                    # get the next response provided by the current participant
-                    text = row[i]
-                    response = response_text_map.get(preprocess_response(text))
-                    if response is None or response.cluster is None:
-                        row.append("")
-                        continue
-                    # TODO: need an index for the cluster
-                    row.append(response.cluster.id.hex)
-                rows.append(row)
-
-        with open(run.output_file_path, "w", encoding="utf-8") as f:
+        # TODO: need an index for the cluster
+        cluster_ids = {
+            response.text: response.cluster.id.hex
+            for response in run.result.get_all_responses()
+            if response.cluster is not None
+        }
+        # Cluster column of every unique response, empty cells (-1) map to the last entry
+        response_clusters = np.array(
+            [cluster_ids.get(response, "") for response in parsed_input.responses]
+            + [""],
+            dtype=object,
+        )
+        cluster_cells = response_clusters[parsed_input.cells].tolist()
+
+        # The parse only keeps the selected columns, the other columns are
+        # copied from the file record by record
+        with open(run.file_path, "r", encoding="utf-8") as input_file, open(
+            run.output_file_path, "w", encoding="utf-8"
+        ) as f:
+            reader = csv.reader(input_file, delimiter=file_settings.delimiter)
             writer = csv.writer(
                 f, delimiter=file_settings.delimiter, lineterminator="\n"
             )
             if file_settings.has_header:
                 # add the new columns to the header
-                new_header = rows[0].copy()
-                for i in file_settings.selected_columns:
-                    selected_header = rows[0][i]
-                    new_header.append(f"{selected_header}_cluster_index")
-
-                # write the header
-                writer.writerow(new_header)
-                writer.writerows(rows[1:])
-            else:
-                writer.writerows(rows)
+                header = next(reader)
+                writer.writerow(
+                    header
+                    + [
+                        f"{header[i]}_cluster_index"
+                        for i in file_settings.selected_columns
+                    ]
+                )
+            for row, row_clusters in zip(reader, cluster_cells):
+                writer.writerow(row + row_clusters)
 
     def create_assignments_file(self, run: Run):
         if not run.result:
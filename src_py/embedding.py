@@ -0,0 +1,172 @@
+import time
+from typing import Callable, Optional
+
+import numpy as np
+from loguru import logger
+from sentence_transformers import SentenceTransformer
+
+from models import EmbeddingProgressMessage, StepType
+from utils.ipc import print_message
+
+DEFAULT_BATCH_SIZE = 32
+# Progress messages are sent at most this often, plus once at the end
+PROGRESS_INTERVAL_SECONDS = 0.5
+
+
+def get_cache_key(model_name: str, max_seq_length: Optional[int] = None) -> str:
+    """
+    Name under which the embeddings of a model are cached.
+
+    Texts cut to a sequence length limit embed differently from the full
+    texts, so every limit gets its own cache next to the unlimited one,
+    which keeps the bare model name.
+    """
+    return model_name if max_seq_length is None else f"{model_name}#{max_seq_length}"
+
+
+def get_token_lengths(embedding_model: SentenceTransformer, texts: list[str]):
+    """Token count of every text, falling back to the character count"""
+    tokenizer = getattr(embedding_model, "tokenizer", None)
+    if tokenizer is None:
+        return np.array([len(text) for text in texts])
+    try:
+        input_ids = tokenizer(
+            texts,
+            add_special_tokens=True,
+            truncation=True,
+            max_length=embedding_model.max_seq_length,
+        )["input_ids"]
+        return np.array([len(ids) for ids in input_ids])
+    except Exception as e:
+        logger.warning(f"Failed to tokenize texts for length bucketing: {e}")
+        return np.array([len(text) for text in texts])
+
+
+def truncate_texts(
+    embedding_model: SentenceTransformer, texts: list[str], max_seq_length: int
+) -> list[str]:
+    """
+    Texts cut to at most max_seq_length tokens, special tokens included.
+
+    The shared model keeps its own limit, so callers with different limits
+    can use it at the same time. Texts that are too long are cut at the
+    token level and decoded back, which normalizes them the way the
+    tokenizer does, e.g. lowercases them for uncased models.
+    """
+    tokenizer = getattr(embedding_model, "tokenizer", None)
+    if tokenizer is None:
+        return texts
+    try:
+        max_tokens = max(max_seq_length - tokenizer.num_special_tokens_to_add(), 1)
+        input_ids = tokenizer(texts, add_special_tokens=False)["input_ids"]
+        return [
+            tokenizer.decode(ids[:max_tokens]) if len(ids) > max_tokens else text
+            for text, ids in zip(texts, input_ids)
+        ]
+    except Exception as e:
+        logger.warning(f"Failed to truncate texts to {max_seq_length} tokens: {e}")
+        return texts
+
+
+class EmbeddingProgress:
+    """Reports per-batch embedding progress with throughput over IPC"""
+
+    def __init__(self, step: StepType, total: int):
+        self.step = step
+        self.total = total
+        self.completed = 0
+        self.start_time = time.time()
+        self._last_report = 0.0
+
+    def update(self, batch_size: int):
+        self.completed += batch_size
+        now = time.time()
+        if (
+            now - self._last_report < PROGRESS_INTERVAL_SECONDS
+            and self.completed < self.total
+        ):
+            return
+        self._last_report = now
+        elapsed = max(now - self.start_time, 1e-9)
+        print_message(
+            "embedding_progress",
+            EmbeddingProgressMessage(
+                step=self.step,
+                completed=self.completed,
+                total=self.total,
+                texts_per_second=self.completed / elapsed,
+            ),
+        )
+
+
+def encode_texts(
+    embedding_model: SentenceTransformer,
+    texts: list[str],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_seq_length: Optional[int] = None,
+    on_batch: Optional[Callable[[int], None]] = None,
+    process_pool: Optional[dict] = None,
+) -> np.ndarray:
+    """
+    Embed texts in batches of similar token length.
+
+    The texts are sorted by token length and cut into consecutive batches, so
+    each batch only pads to the length of its own longest text. The returned
+    embeddings are normalized and in the order of `texts`.
+
+    Args:
+        embedding_model: Loaded embedding model
+        texts: Texts to embed
+        batch_size: Number of texts per batch
+        max_seq_length: Truncate texts to this many tokens if it is below the
+            model default
+        on_batch: Called with the number of texts after every batch
+        process_pool: Worker processes from `start_multi_process_pool`. Every
+            worker encodes one batch of each round, so a round holds one
+            batch per worker.
+    """
+    if not texts:
+        return np.empty((0, embedding_model.get_sentence_embedding_dimension() or 0))
+
+    # The model may be shared through the pool, so the texts are truncated
+    # instead of changing its limit
+    model_max_seq_length = embedding_model.max_seq_length
+    if max_seq_length and (
+        model_max_seq_length is None or max_seq_length < model_max_seq_length
+    ):
+        texts = truncate_texts(embedding_model, texts, max_seq_length)
+    order = np.argsort(get_token_lengths(embedding_model, texts), kind="stable")
+    embeddings: Optional[np.ndarray] = None
+    step = batch_size
+    if process_pool is not None:
+        step = batch_size * len(process_pool["processes"])
+    for start in range(0, len(texts), step):
+        batch_indices = order[start : start + step]
+        batch_texts = [texts[i] for i in batch_indices]
+        if process_pool is not None:
+            batch_embeddings = embedding_model.encode_multi_process(
+                batch_texts,
+                process_pool,
+                batch_size=batch_size,
+                chunk_size=batch_size,
+                normalize_embeddings=True,
+            )
+        else:
+            batch_embeddings = embedding_model.encode(
+                batch_texts,
+                batch_size=len(batch_indices),
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+        if embeddings is None:
+            embeddings = np.empty(
+                (len(texts), batch_embeddings.shape[1]),
+                dtype=batch_embeddings.dtype,
+            )
+        embeddings[batch_indices] = batch_embeddings
+        if on_batch is not None:
+            on_batch(len(batch_indices))
+    assert embeddings is not None
+    return embeddings
+
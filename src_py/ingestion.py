@@ -0,0 +1,353 @@
+import csv
+import io
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterator, Optional
+
+import numpy as np
+from loguru import logger
+from models import FileSettings
+from utils.matching import ExcludedWordsMatcher
+from utils.utils import preprocess_response
+
+# Files below this size are parsed in-process, spawning workers is not worth it
+PARALLEL_MIN_FILE_SIZE = 32 * 1024**2
+CHUNK_SIZE = 16 * 1024**2
+SCAN_BLOCK_SIZE = 8 * 1024**2
+DEFAULT_MAX_PARSED_INPUTS = 4
+
+
+class ChunkResult:
+    """Responses parsed from one byte range of the input file"""
+
+    def __init__(
+        self, responses: list[str], cells: np.ndarray, invalid_column_count: int
+    ):
+        # Unique responses in order of first occurrence within the range
+        self.responses = responses
+        # Index into `responses` for every record and selected column, -1 if empty
+        self.cells = cells
+        self.invalid_column_count = invalid_column_count
+
+
+class ParsedInput:
+    """
+    Deduplicated responses of the selected columns of an input file.
+
+    Besides the unique responses and their counts, the mapping from every
+    record and selected column to its response is kept, so the preview and
+    the output file can be produced without parsing the file again.
+    """
+
+    def __init__(self, column_count: int):
+        self.responses: list[str] = []
+        self.cells = np.empty((0, column_count), dtype=np.int32)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.invalid_column_count = 0
+        self._response_ids: dict[str, int] = {}
+        self._chunk_cells: list[np.ndarray] = []
+
+    @property
+    def row_count(self) -> int:
+        return len(self.cells)
+
+    def add_chunk(self, chunk: ChunkResult) -> list[str]:
+        """
+        Merge a parsed chunk. Chunks have to be added in file order.
+
+        Returns:
+            The responses that were seen for the first time in this chunk
+        """
+        first_new = len(self.responses)
+        mapping = np.empty(len(chunk.responses), dtype=np.int32)
+        for local_id, response in enumerate(chunk.responses):
+            response_id = self._response_ids.get(response)
+            if response_id is None:
+                response_id = len(self.responses)
+                self._response_ids[response] = response_id
+                self.responses.append(response)
+            mapping[local_id] = response_id
+        cells = chunk.cells
+        if len(mapping) > 0:
+            cells = np.where(cells >= 0, mapping[np.maximum(cells, 0)], -1)
+        self._chunk_cells.append(cells.astype(np.int32, copy=False))
+        self.invalid_column_count += chunk.invalid_column_count
+        return self.responses[first_new:]
+
+    def finish(self):
+        """Assemble the record mapping and counts once all chunks are added"""
+        if self._chunk_cells:
+            self.cells = np.concatenate(self._chunk_cells)
+        valid_cells = self.cells[self.cells >= 0]
+        self.counts = np.bincount(valid_cells, minlength=len(self.responses))
+        self._chunk_cells = []
+        self._response_ids = {}
+        if self.invalid_column_count:
+            logger.warning(
+                f"Skipped {self.invalid_column_count} invalid column entries"
+            )
+
+    def raw_responses(self) -> list[str]:
+        """All non-empty responses in file order, including duplicates"""
+        return [self.responses[i] for i in self.cells[self.cells >= 0]]
+
+    def count_responses(self, excluded_words: list[str]) -> Counter[str]:
+        """Count the responses that do not contain an excluded word"""
+        matcher = ExcludedWordsMatcher(excluded_words)
+        response_counter: Counter[str] = Counter()
+        excluded_count = 0
+        for response, count in zip(self.responses, self.counts.tolist()):
+            if matcher and matcher.is_excluded(response):
+                excluded_count += count
+                continue
+            response_counter[response] = count
+        if excluded_count:
+            logger.info(
+                f"Excluded {excluded_count} responses containing excluded words"
+            )
+        return response_counter
+
+
+def find_chunk_boundaries(
+    file_path: str, chunk_size: int, skip_header: bool
+) -> list[tuple[int, int]]:
+    """
+    Split a CSV file into byte ranges that each start at a record boundary.
+
+    A newline ends a record only if an even number of quote characters
+    precedes it, since RFC 4180 escapes quotes inside quoted fields by
+    doubling them. Splitting at such newlines keeps multi-line fields intact.
+
+    Args:
+        file_path: Path to the CSV file
+        chunk_size: Approximate number of bytes per range
+        skip_header: Whether the first record is a header that should be skipped
+
+    Returns:
+        List of (start, end) byte offsets
+    """
+    file_size = os.path.getsize(file_path)
+    boundaries = [0]
+    # The header ends at the first record boundary, chunks start after it
+    next_target = 0 if skip_header else chunk_size
+    quote_parity = 0
+    block_offset = 0
+    with open(file_path, "rb") as f:
+        while True:
+            block = f.read(SCAN_BLOCK_SIZE)
+            if not block:
+                break
+            # Quotes in block[:position] are already counted in quote_parity
+            position = 0
+            while True:
+                search_from = max(next_target - block_offset, position)
+                if search_from >= len(block):
+                    break
+                newline = block.find(b"\n", search_from)
+                if newline == -1:
+                    break
+                quote_parity ^= block.count(b'"', position, newline) & 1
+                position = newline + 1
+                if quote_parity == 0:
+                    boundary = block_offset + position
+                    boundaries.append(boundary)
+                    next_target = boundary + chunk_size
+            quote_parity ^= block.count(b'"', position) & 1
+            block_offset += len(block)
+
+    if skip_header:
+        # A file without a record boundary consists only of the header
+        if len(boundaries) == 1:
+            return []
+        boundaries = boundaries[1:]
+    if boundaries[-1] < file_size:
+        boundaries.append(file_size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def parse_chunk(
+    file_path: str,
+    start: int,
+    end: int,
+    file_settings: FileSettings,
+) -> ChunkResult:
+    """Parse one byte range of the input file and deduplicate its responses"""
+    response_ids: dict[str, int] = {}
+    cells: list[list[int]] = []
+    invalid_column_count = 0
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    # Universal newlines, as if the whole file had been opened in text mode
+    text = io.StringIO(data.decode("utf-8"), newline=None)
+    reader = csv.reader(text, delimiter=file_settings.delimiter)
+    for row in reader:
+        row_cells = []
+        for column_index in file_settings.selected_columns:
+            if column_index >= len(row):
+                invalid_column_count += 1
+                row_cells.append(-1)
+                continue
+            # get the next entry provided by the current participant
+            response = preprocess_response(row[column_index])
+            if response == "" or response is None:
+                row_cells.append(-1)
+                continue
+            row_cells.append(response_ids.setdefault(response, len(response_ids)))
+        cells.append(row_cells)
+    return ChunkResult(
+        responses=list(response_ids.keys()),
+        cells=np.array(cells, dtype=np.int32).reshape(
+            len(cells), len(file_settings.selected_columns)
+        ),
+        invalid_column_count=invalid_column_count,
+    )
+
+
+def iter_chunks(
+    file_path: str,
+    file_settings: FileSettings,
+    max_workers: Optional[int] = None,
+) -> Iterator[ChunkResult]:
+    """
+    Parse the input file chunk by chunk, yielding the chunks in file order.
+
+    Large files are split into byte ranges that are parsed and deduplicated
+    in parallel worker processes. At most two ranges per worker are in flight
+    at any time, so memory stays bounded by the number of unique responses
+    rather than the size of the file.
+    """
+    if max_workers is None:
+        max_workers = max((os.cpu_count() or 1) - 1, 1)
+    file_size = os.path.getsize(file_path)
+    chunk_size = CHUNK_SIZE if file_size >= PARALLEL_MIN_FILE_SIZE else file_size + 1
+    chunks = find_chunk_boundaries(file_path, chunk_size, file_settings.has_header)
+
+    if len(chunks) <= 1 or max_workers <= 1:
+        for start, end in chunks:
+            yield parse_chunk(file_path, start, end, file_settings)
+        return
+
+    logger.info(
+        f"Parsing {len(chunks)} chunks of {file_path} with {max_workers} workers"
+    )
+    # Spawned rather than forked, the cache, model pool and precompute threads
+    # may be running and forking a threaded process can deadlock
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        pending: deque[Future[ChunkResult]] = deque()
+        for start, end in chunks:
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+            pending.append(
+                executor.submit(parse_chunk, file_path, start, end, file_settings)
+            )
+        while pending:
+            yield pending.popleft().result()
+
+
+def parse_input(
+    file_path: str,
+    file_settings: FileSettings,
+    max_workers: Optional[int] = None,
+) -> ParsedInput:
+    parsed_input = ParsedInput(len(file_settings.selected_columns))
+    for chunk in iter_chunks(file_path, file_settings, max_workers):
+        parsed_input.add_chunk(chunk)
+    parsed_input.finish()
+    return parsed_input
+
+
+class ParsedInputCache:
+    """
+    Keeps the parsed form of recently used input files.
+
+    Entries are keyed by file path, modification time, size and file
+    settings, so an edited file or a different column selection is parsed
+    again. The preview, the clustering run and the output file export of a
+    session all share the same parse.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_PARSED_INPUTS):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, ParsedInput] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_key(self, file_path: str, file_settings: FileSettings) -> tuple:
+        stat = os.stat(file_path)
+        return (
+            os.path.abspath(file_path),
+            stat.st_mtime_ns,
+            stat.st_size,
+            file_settings.model_dump_json(),
+        )
+
+    def get(self, file_path: str, file_settings: FileSettings) -> ParsedInput:
+        """Get the parsed input file, parsing it if it is not cached"""
+        key = self._get_key(file_path, file_settings)
+        # Holding the lock while parsing keeps concurrent callers from
+        # parsing the same file twice
+        with self._lock:
+            parsed_input = self._entries.get(key)
+            if parsed_input is not None:
+                logger.debug(f"Using cached parse of {file_path}")
+                self._entries.move_to_end(key)
+                return parsed_input
+            start_time = time.time()
+            parsed_input = parse_input(file_path, file_settings)
+            logger.info(
+                f"Parsed {file_path} ({parsed_input.row_count} rows, {len(parsed_input.responses)} unique responses) in {time.time() - start_time:.2f}s"
+            )
+            self._store(key, parsed_input)
+            return parsed_input
+
+    def iter_new_responses(
+        self, file_path: str, file_settings: FileSettings
+    ) -> Iterator[list[str]]:
+        """
+        Parse the input file like `get`, but yield the responses that are seen
+        for the first time as soon as each chunk is parsed. A cached parse is
+        yielded in one piece. Once the generator is exhausted, the finished
+        parse is available from `get`.
+        """
+        key = self._get_key(file_path, file_settings)
+        with self._lock:
+            parsed_input = self._entries.get(key)
+            if parsed_input is not None:
+                self._entries.move_to_end(key)
+        if parsed_input is not None:
+            logger.debug(f"Using cached parse of {file_path}")
+            yield list(parsed_input.responses)
+            return
+
+        start_time = time.time()
+        parsed_input = ParsedInput(len(file_settings.selected_columns))
+        for chunk in iter_chunks(file_path, file_settings):
+            yield parsed_input.add_chunk(chunk)
+        parsed_input.finish()
+        logger.info(
+            f"Parsed {file_path} ({parsed_input.row_count} rows, {len(parsed_input.responses)} unique responses) in {time.time() - start_time:.2f}s"
+        )
+        with self._lock:
+            self._store(key, parsed_input)
+
+    def put(
+        self, file_path: str, file_settings: FileSettings, parsed_input: ParsedInput
+    ):
+        with self._lock:
+            self._store(self._get_key(file_path, file_settings), parsed_input)
+
+    def _store(self, key: tuple, parsed_input: ParsedInput):
+        self._entries[key] = parsed_input
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
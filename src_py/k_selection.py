@@ -0,0 +1,644 @@
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterable, Mapping, Optional, Union
+
+import numpy as np
+from loguru import logger
+from sklearn.cluster import KMeans
+from threadpoolctl import threadpool_limits
+
+from alt_clustering.mini_batch_spherical_k_means import MiniBatchSphericalKMeans
+from alt_clustering.spherical_k_means import SphericalKMeans
+from neighbors import get_tile_rows
+
+# Silhouette, Calinski-Harabasz and Davies-Bouldin score of one cluster count,
+# None for metrics that are not used
+KScores = tuple[Optional[float], Optional[float], Optional[float]]
+# Labels of one cluster count and its raw metrics by name
+KResult = tuple[np.ndarray, dict[str, float]]
+METRIC_NAMES = ("silhouette", "calinski_harabasz", "davies_bouldin")
+# Pairwise distances up to this size are computed once for all cluster counts
+DEFAULT_MAX_DISTANCE_BYTES = 1024**3
+# Number of cluster counts in the first grid of a coarse to fine search
+COARSE_GRID_POINTS = 12
+GOLDEN_RATIO_CONJUGATE = (math.sqrt(5) - 1) / 2
+# Methods that cluster by cosine similarity and keep normalized centers
+SPHERICAL_KMEANS_METHODS = ("spherical_kmeans", "minibatch_spherical_kmeans")
+
+
+def make_kmeans(
+    k: int,
+    kmeans_method: str,
+    random_state: Optional[int],
+    init: Optional[np.ndarray] = None,
+) -> Union[KMeans, SphericalKMeans, MiniBatchSphericalKMeans]:
+    """
+    Unfitted k-means model of the configured method, seeded with k-means++
+    or with the given initial centers.
+    """
+    if kmeans_method == "spherical_kmeans":
+        if init is not None:
+            return SphericalKMeans(n_clusters=k, init=init, random_state=random_state)
+        return SphericalKMeans(n_clusters=k, random_state=random_state)
+    if kmeans_method == "minibatch_spherical_kmeans":
+        if init is not None:
+            return MiniBatchSphericalKMeans(
+                n_clusters=k, init=init, random_state=random_state
+            )
+        return MiniBatchSphericalKMeans(n_clusters=k, random_state=random_state)
+    if init is not None:
+        return KMeans(n_clusters=k, init=init, n_init=1, random_state=random_state)
+    return KMeans(n_clusters=k, n_init="auto", random_state=random_state)
+
+
+def fit_kmeans(
+    embeddings: np.ndarray,
+    weights: np.ndarray,
+    k: int,
+    kmeans_method: str,
+    random_state: Optional[int],
+    init: Optional[np.ndarray] = None,
+) -> Union[KMeans, SphericalKMeans, MiniBatchSphericalKMeans]:
+    """k-means fit with k clusters"""
+    return make_kmeans(k, kmeans_method, random_state, init).fit(
+        embeddings, sample_weight=weights
+    )
+
+
+def get_centers(
+    embeddings: np.ndarray,
+    weights: np.ndarray,
+    labels: np.ndarray,
+    k: int,
+    kmeans_method: str,
+) -> Optional[np.ndarray]:
+    """
+    Weighted mean of every cluster, normalized for spherical k-means, or None
+    if a cluster has no members
+    """
+    counts = np.bincount(labels, minlength=k)
+    if len(counts) != k or np.any(counts == 0):
+        return None
+    order = np.argsort(labels, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    centers = np.add.reduceat(
+        embeddings[order] * weights[order, None], starts, axis=0
+    )
+    centers /= np.bincount(labels, weights=weights, minlength=k)[:, None]
+    if kmeans_method in SPHERICAL_KMEANS_METHODS:
+        centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    return centers
+
+
+def split_worst_cluster(
+    embeddings: np.ndarray,
+    weights: np.ndarray,
+    centers: np.ndarray,
+    labels: np.ndarray,
+    kmeans_method: str,
+    random_state: Optional[int],
+) -> tuple[np.ndarray, int]:
+    """
+    Initial centers for the next cluster count, from a fit with one cluster
+    less, and the Lloyd iterations the split took.
+
+    The cluster with the largest weighted inertia, cosine distance for
+    spherical k-means and squared euclidean distance otherwise, is split in
+    two by a k-means fit on its members. All other centers are kept.
+    """
+    own_centers = centers[labels]
+    if kmeans_method in SPHERICAL_KMEANS_METHODS:
+        distances = 1 - np.einsum("ij,ij->i", embeddings, own_centers)
+    else:
+        distances = np.sum((embeddings - own_centers) ** 2, axis=1)
+    inertias = np.bincount(
+        labels, weights=distances * weights, minlength=len(centers)
+    )
+    # Clusters with a single member cannot be split
+    inertias[np.bincount(labels, minlength=len(centers)) < 2] = -np.inf
+    worst = int(np.argmax(inertias))
+    members = labels == worst
+    split = fit_kmeans(
+        embeddings[members], weights[members], 2, kmeans_method, random_state
+    )
+    halves = split.cluster_centers_
+    return np.vstack([centers[:worst], halves, centers[worst + 1 :]]), split.n_iter_
+
+
+class KSelectionMetrics:
+    """
+    Silhouette, Calinski-Harabasz and Davies-Bouldin scores of many
+    labelings of the same embeddings.
+
+    The scores match the sklearn functions of the same name, but the work
+    that does not depend on the labels is done once. Pairwise distances are
+    derived from the Gram matrix as sqrt(|x|^2 + |y|^2 - 2 x.y) and kept for
+    all labelings if they fit into `max_distance_bytes`, otherwise they are
+    recomputed in tiles for every labeling. Silhouette then takes one
+    product of the distances with the one-hot labels. Calinski-Harabasz and
+    Davies-Bouldin only need the distances of every embedding to its own
+    centroid and between the centroids, which are O(N * d) and O(K^2 * d).
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        metrics: set[str],
+        max_distance_bytes: int = DEFAULT_MAX_DISTANCE_BYTES,
+    ):
+        self.metrics = metrics
+        self.max_distance_bytes = max_distance_bytes
+        # Distances are stored in the precision of the embeddings, like sklearn
+        self.distance_dtype = (
+            np.float32 if embeddings.dtype == np.float32 else np.float64
+        )
+        self.embeddings = np.asarray(embeddings, dtype=np.float64)
+        self.squared_norms = np.einsum("ij,ij->i", self.embeddings, self.embeddings)
+        self.mean = self.embeddings.mean(axis=0)
+
+        # Computed with the first silhouette score
+        self.distances: Optional[np.ndarray] = None
+
+    def _get_all_distances(self) -> Optional[np.ndarray]:
+        """All pairwise distances if they fit into the budget, otherwise None"""
+        n = len(self.embeddings)
+        itemsize = np.dtype(self.distance_dtype).itemsize
+        if self.distances is None and n * n * itemsize <= self.max_distance_bytes:
+            self.distances = np.empty((n, n), dtype=self.distance_dtype)
+            for start, end in self._tiles():
+                self.distances[start:end] = self._get_distances(start, end)
+        return self.distances
+
+    def _tiles(self):
+        n = len(self.embeddings)
+        tile_rows = get_tile_rows(n, n, self.embeddings.dtype.itemsize)
+        for start in range(0, n, tile_rows):
+            yield start, min(start + tile_rows, n)
+
+    def _get_distances(self, start: int, end: int) -> np.ndarray:
+        """Euclidean distances of the embeddings in start:end to all embeddings"""
+        distances = self.embeddings[start:end] @ self.embeddings.T
+        distances *= -2
+        distances += self.squared_norms[start:end, None]
+        distances += self.squared_norms[None, :]
+        np.maximum(distances, 0, out=distances)
+        np.sqrt(distances, out=distances)
+        # The distance of an embedding to itself is exactly zero
+        rows = np.arange(end - start)
+        distances[rows, rows + start] = 0
+        return distances.astype(self.distance_dtype, copy=False)
+
+    def score(
+        self, labels: np.ndarray, metrics: Optional[set[str]] = None
+    ) -> KScores:
+        """Evaluate the selected metrics, or the given subset, for one labeling"""
+        if metrics is None:
+            metrics = self.metrics
+        _, labels = np.unique(labels, return_inverse=True)
+        counts = np.bincount(labels)
+        n, n_labels = len(labels), len(counts)
+        if not 1 < n_labels < n:
+            raise ValueError(
+                f"Number of labels is {n_labels}. Valid values are 2 to n_samples - 1 (inclusive)"
+            )
+
+        silhouette, calinski_harabasz, davies_bouldin = None, None, None
+        if "silhouette" in metrics:
+            silhouette = self._silhouette(labels, counts)
+        if "calinski_harabasz" in metrics or "davies_bouldin" in metrics:
+            centroids, squared_distances = self._centroid_distances(labels, counts)
+            if "calinski_harabasz" in metrics:
+                calinski_harabasz = self._calinski_harabasz(
+                    centroids, squared_distances, counts
+                )
+            if "davies_bouldin" in metrics:
+                davies_bouldin = self._davies_bouldin(
+                    centroids, squared_distances, labels, counts
+                )
+        return silhouette, calinski_harabasz, davies_bouldin
+
+    def _silhouette(self, labels: np.ndarray, counts: np.ndarray) -> float:
+        n = len(labels)
+        rows = np.arange(n)
+        one_hot = np.zeros((n, len(counts)), dtype=self.distance_dtype)
+        one_hot[rows, labels] = 1
+        distances = self._get_all_distances()
+        if distances is not None:
+            cluster_distances = distances @ one_hot
+        else:
+            cluster_distances = np.empty((n, len(counts)), dtype=self.distance_dtype)
+            for start, end in self._tiles():
+                cluster_distances[start:end] = self._get_distances(start, end) @ one_hot
+
+        intra_distances = cluster_distances[rows, labels]
+        cluster_distances[rows, labels] = np.inf
+        cluster_distances /= counts
+        inter_distances = cluster_distances.min(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            intra_distances /= counts[labels] - 1
+            samples = (inter_distances - intra_distances) / np.maximum(
+                intra_distances, inter_distances
+            )
+        # Clusters of size 1 have undefined scores, which count as 0
+        return float(np.mean(np.nan_to_num(samples)))
+
+    def _centroid_distances(
+        self, labels: np.ndarray, counts: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Centroids and the squared distance of every embedding to its centroid"""
+        order = np.argsort(labels, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        centroids = np.add.reduceat(self.embeddings[order], starts, axis=0)
+        centroids /= counts[:, None]
+        centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+        # In chunks, to avoid materializing the centroid of every embedding
+        dot_products = np.empty(len(labels))
+        for start in range(0, len(labels), 8192):
+            dot_products[start : start + 8192] = np.einsum(
+                "ij,ij->i",
+                self.embeddings[start : start + 8192],
+                centroids[labels[start : start + 8192]],
+            )
+        squared_distances = (
+            self.squared_norms - 2 * dot_products + centroid_norms[labels]
+        )
+        return centroids, np.maximum(squared_distances, 0)
+
+    def _calinski_harabasz(
+        self, centroids: np.ndarray, squared_distances: np.ndarray, counts: np.ndarray
+    ) -> float:
+        n, n_labels = len(squared_distances), len(counts)
+        extra_dispersion = np.sum(counts * np.sum((centroids - self.mean) ** 2, axis=1))
+        intra_dispersion = np.sum(squared_distances)
+        if np.isclose(intra_dispersion, 0.0):
+            return 1.0
+        return float(
+            extra_dispersion * (n - n_labels) / (intra_dispersion * (n_labels - 1.0))
+        )
+
+    def _davies_bouldin(
+        self,
+        centroids: np.ndarray,
+        squared_distances: np.ndarray,
+        labels: np.ndarray,
+        counts: np.ndarray,
+    ) -> float:
+        intra_distances = (
+            np.bincount(labels, weights=np.sqrt(squared_distances)) / counts
+        )
+        centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+        centroid_distances = centroid_norms[:, None] + centroid_norms[None, :]
+        centroid_distances -= 2 * centroids @ centroids.T
+        np.maximum(centroid_distances, 0, out=centroid_distances)
+        np.sqrt(centroid_distances, out=centroid_distances)
+        np.fill_diagonal(centroid_distances, 0)
+        if np.allclose(intra_distances, 0) or np.allclose(centroid_distances, 0):
+            return 0.0
+        centroid_distances[centroid_distances == 0] = np.inf
+        combined_intra_distances = intra_distances[:, None] + intra_distances
+        return float(np.mean(np.max(combined_intra_distances / centroid_distances, axis=1)))
+
+
+# Sweep data of a worker process, sent once by the pool initializer
+_worker_state: dict = {}
+
+
+def _init_worker(
+    embeddings: np.ndarray,
+    weights: np.ndarray,
+    kmeans_method: str,
+    random_state: Optional[int],
+    threads: int,
+):
+    _worker_state.update(
+        embeddings=embeddings,
+        weights=weights,
+        kmeans_method=kmeans_method,
+        random_state=random_state,
+        threads=threads,
+    )
+
+
+def _fit_in_worker(k: int) -> tuple[np.ndarray, np.ndarray, int]:
+    # Every worker gets its share of the cores for BLAS and OpenMP
+    with threadpool_limits(limits=_worker_state["threads"]):
+        kmeans = fit_kmeans(
+            _worker_state["embeddings"],
+            _worker_state["weights"],
+            k,
+            _worker_state["kmeans_method"],
+            _worker_state["random_state"],
+        )
+    return (
+        np.asarray(kmeans.labels_),
+        np.asarray(kmeans.cluster_centers_),
+        int(kmeans.n_iter_),
+    )
+
+
+class KSweep:
+    """
+    Fits and scores cluster counts of one k selection.
+
+    Cluster counts can be evaluated in several batches, as a search strategy
+    narrows down the range, and every count is only fit once. The metric
+    engine and the worker pool are kept for all batches.
+
+    The fits are independent, so with more than one worker they run in a
+    process pool. Every fit is seeded with `random_state` exactly like a
+    sequential sweep, so the scores do not depend on the number of workers.
+    The embeddings are sent to each worker once, and the cores are divided
+    between the workers so that their thread pools do not oversubscribe.
+    Workers only return labels and centers, and the labels are scored in
+    this process by one `KSelectionMetrics` shared by all cluster counts.
+
+    With `warm_start`, the cluster counts are fit in increasing order in this
+    process instead, and a fit whose count is one more than the previous fit
+    starts from the previous centers with the worst cluster split in two.
+    Those starts are already close to a solution, so the fits can take fewer
+    Lloyd iterations than cold starts, though the split fits add their own.
+    The fits end in other local optima than cold starts, so the selected
+    count may differ.
+
+    `cached_results` holds labels and raw metrics of an earlier sweep with
+    the same embeddings and fit parameters. Those cluster counts are not fit
+    again, and metrics the earlier sweep did not compute are scored from the
+    stored labels. Warm fits depend on the chain of fits before them, so for
+    a warm sweep the earlier sweep must have evaluated the same counts in the
+    same order.
+
+    The fitted labels and centers of every cluster count are kept, so the
+    final clustering can take the model of the chosen count from `get_fit`
+    instead of fitting it again.
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        weights: np.ndarray,
+        kmeans_method: str,
+        metrics: set[str],
+        random_state: Optional[int],
+        workers: int = 1,
+        warm_start: bool = False,
+        cached_results: Optional[Mapping[int, KResult]] = None,
+    ):
+        self.embeddings = embeddings
+        self.weights = weights
+        self.kmeans_method = kmeans_method
+        self.metrics = metrics
+        self.random_state = random_state
+        self.warm_start = warm_start
+        self.workers = 1 if warm_start else max(min(workers, os.cpu_count() or 1), 1)
+        self.engine = KSelectionMetrics(embeddings, metrics)
+        self.scores: dict[int, KScores] = {}
+        # Labels and all known raw metrics of every evaluated cluster count
+        self.results: dict[int, KResult] = {}
+        # Centers of the cluster counts fit by this sweep
+        self.centers: dict[int, np.ndarray] = {}
+        self.cached_results = cached_results or {}
+        self.lloyd_iterations = 0
+        self.reused_count = 0
+        # Cluster count, labels and centers of the last fit, to warm start from
+        self._previous: Optional[tuple[int, np.ndarray, Optional[np.ndarray]]] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._start_time = time.time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        logger.info(
+            f"Scored {len(self.scores)} cluster counts ({self.reused_count} from an earlier sweep) with {self.workers} workers in {time.time() - self._start_time:.2f}s ({self.lloyd_iterations} Lloyd iterations)"
+        )
+
+    def evaluate(self, k_values: Iterable[int]):
+        """Fit and score the cluster counts that have not been evaluated yet"""
+        k_values = sorted(set(k_values) - self.scores.keys())
+        fit_k_values = []
+        for k in k_values:
+            if k in self.cached_results:
+                self._reuse(k)
+            elif self.warm_start:
+                self._fit_warm(k)
+            else:
+                fit_k_values.append(k)
+
+        if self.workers == 1 or len(fit_k_values) == 1:
+            for k in fit_k_values:
+                kmeans = fit_kmeans(
+                    self.embeddings,
+                    self.weights,
+                    k,
+                    self.kmeans_method,
+                    self.random_state,
+                )
+                self.lloyd_iterations += kmeans.n_iter_
+                self.centers[k] = np.asarray(kmeans.cluster_centers_)
+                self._add_result(k, np.asarray(kmeans.labels_), {})
+        elif fit_k_values:
+            executor = self._get_executor()
+            # Large cluster counts take longest and are submitted first
+            futures = {
+                executor.submit(_fit_in_worker, k): k
+                for k in reversed(fit_k_values)
+            }
+            # Labels are scored while the remaining fits are running
+            for future in as_completed(futures):
+                labels, centers, n_iter = future.result()
+                self.lloyd_iterations += n_iter
+                self.centers[futures[future]] = centers
+                self._add_result(futures[future], labels, {})
+
+    def _add_result(self, k: int, labels: np.ndarray, known_metrics: dict[str, float]):
+        """Score the metrics that are not known yet and record the result"""
+        missing = self.metrics - known_metrics.keys()
+        metrics = dict(known_metrics)
+        if missing:
+            scores = self.engine.score(labels, missing)
+            for name, value in zip(METRIC_NAMES, scores):
+                if value is not None:
+                    metrics[name] = value
+        self.results[k] = (labels, metrics)
+        silhouette, calinski_harabasz, davies_bouldin = (
+            metrics[name] if name in self.metrics else None for name in METRIC_NAMES
+        )
+        self.scores[k] = (silhouette, calinski_harabasz, davies_bouldin)
+
+    def _reuse(self, k: int):
+        labels, metrics = self.cached_results[k]
+        self.reused_count += 1
+        self._previous = (k, labels, None)
+        self._add_result(k, labels, metrics)
+
+    def _fit_warm(self, k: int):
+        init = None
+        if self._previous is not None and self._previous[0] == k - 1:
+            _, labels, centers = self._previous
+            if centers is None:
+                centers = get_centers(
+                    self.embeddings, self.weights, labels, k - 1, self.kmeans_method
+                )
+            if centers is not None:
+                init, split_iterations = split_worst_cluster(
+                    self.embeddings,
+                    self.weights,
+                    centers,
+                    labels,
+                    self.kmeans_method,
+                    self.random_state,
+                )
+                # The split fit only covers the members of one cluster, but
+                # is counted like a full iteration
+                self.lloyd_iterations += split_iterations
+        kmeans = fit_kmeans(
+            self.embeddings,
+            self.weights,
+            k,
+            self.kmeans_method,
+            self.random_state,
+            init,
+        )
+        labels = np.asarray(kmeans.labels_)
+        self._previous = (k, labels, kmeans.cluster_centers_)
+        self.centers[k] = np.asarray(kmeans.cluster_centers_)
+        self.lloyd_iterations += kmeans.n_iter_
+        self._add_result(k, labels, {})
+
+    def get_fit(self, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Labels and centers of an evaluated cluster count. Counts reused from
+        an earlier sweep get the weighted means of their clusters as centers,
+        with empty clusters dropped and the labels renumbered.
+        """
+        labels = self.results[k][0]
+        if k in self.centers:
+            return labels, self.centers[k]
+        _, labels = np.unique(labels, return_inverse=True)
+        n_labels = int(labels.max()) + 1
+        centers = get_centers(
+            self.embeddings, self.weights, labels, n_labels, self.kmeans_method
+        )
+        return labels, centers
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            cpu_count = os.cpu_count() or 1
+            # Spawned rather than forked, OpenMP and the model's threads are not fork safe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(
+                    self.embeddings,
+                    self.weights,
+                    self.kmeans_method,
+                    self.random_state,
+                    max(cpu_count // self.workers, 1),
+                ),
+            )
+        return self._executor
+
+
+def normalize_scores(
+    scores: list[KScores], metric_weights: dict[str, float]
+) -> tuple[dict[str, np.ndarray], np.ndarray]:
+    """
+    Min-max normalized metrics of the given cluster counts and their
+    weighted combination. Davies-Bouldin is inverted, so that higher is
+    better for every metric.
+    """
+    normalized: dict[str, np.ndarray] = {}
+    combined = np.zeros(len(scores))
+    for index, name in enumerate(METRIC_NAMES):
+        if name not in metric_weights:
+            continue
+        values = np.array([score[index] for score in scores], dtype=float)
+        value_range = np.max(values) - np.min(values)
+        if value_range > 0:
+            values = (values - np.min(values)) / value_range
+        else:
+            values = np.zeros(len(values))
+        if name == "davies_bouldin":
+            values = 1 - values
+        normalized[name] = values
+        combined += values * metric_weights[name]
+    if normalized:
+        combined /= len(normalized)
+    return normalized, combined
+
+
+def get_best_k(sweep: KSweep, metric_weights: dict[str, float]) -> int:
+    """Evaluated cluster count with the highest combined score"""
+    k_values = sorted(sweep.scores)
+    _, combined = normalize_scores(
+        [sweep.scores[k] for k in k_values], metric_weights
+    )
+    return k_values[int(np.argmax(combined))]
+
+
+def search_k(
+    sweep: KSweep,
+    min_k: int,
+    max_k: int,
+    search: str,
+    metric_weights: dict[str, float],
+):
+    """
+    Evaluate the cluster counts from min_k to max_k that a search strategy
+    needs to find the best combined score.
+
+    exhaustive evaluates every count. coarse_to_fine evaluates a grid of
+    about COARSE_GRID_POINTS counts, then repeatedly a four times finer grid
+    around the best count so far, down to a step of one. golden_section
+    assumes a single peak and narrows the range by the golden ratio with
+    one or two fits per step, then evaluates the last few counts. Ranges
+    that are not much wider than the coarse grid are always evaluated
+    exhaustively.
+    """
+    if search == "exhaustive" or max_k - min_k < 2 * COARSE_GRID_POINTS:
+        sweep.evaluate(range(min_k, max_k + 1))
+        return
+
+    if search == "coarse_to_fine":
+        low, high = min_k, max_k
+        step = math.ceil((max_k - min_k) / (COARSE_GRID_POINTS - 1))
+        while True:
+            sweep.evaluate([*range(low, high + 1, step), high])
+            if step == 1:
+                return
+            best_k = get_best_k(sweep, metric_weights)
+            low, high = max(min_k, best_k - step), min(max_k, best_k + step)
+            step = math.ceil(step / 4)
+
+    if search == "golden_section":
+        low, high = min_k, max_k
+        while high - low > 3:
+            inner = round((high - low) * GOLDEN_RATIO_CONJUGATE)
+            left, right = high - inner, low + inner
+            if left >= right:
+                left, right = right - 1, right
+            sweep.evaluate([left, right])
+            # Normalized over everything evaluated so far
+            k_values = sorted(sweep.scores)
+            _, combined = normalize_scores(
+                [sweep.scores[k] for k in k_values], metric_weights
+            )
+            combined_by_k = dict(zip(k_values, combined))
+            if combined_by_k[left] >= combined_by_k[right]:
+                high = right
+            else:
+                low = left
+        sweep.evaluate(range(low, high + 1))
+        return
+
+    raise ValueError(f"Unknown k selection search: {search}")
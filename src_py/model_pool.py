@@ -0,0 +1,210 @@
+import gc
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import torch
+from loguru import logger
+from sentence_transformers import SentenceTransformer
+
+from utils.utils import get_env_float
+
+# Models that have not been used for this long are unloaded
+DEFAULT_IDLE_TIMEOUT_SECONDS = 10 * 60
+# Combined parameter memory of all loaded models
+DEFAULT_MAX_POOL_BYTES = 4 * 1024**3
+IDLE_CHECK_INTERVAL_SECONDS = 30
+
+
+class _PooledModel:
+    def __init__(self, model: SentenceTransformer):
+        self.model = model
+        self.size = sum(
+            parameter.numel() * parameter.element_size()
+            for parameter in model.parameters()
+        )
+        self.last_used = time.time()
+        self.in_use = 0
+        # Worker processes holding copies of the model, see `get_process_pool`
+        self.process_pool: Optional[dict] = None
+        self.process_pool_key: Optional[tuple] = None
+
+    def stop_process_pool(self):
+        if self.process_pool is None:
+            return
+        SentenceTransformer.stop_multi_process_pool(self.process_pool)
+        self.process_pool = None
+        self.process_pool_key = None
+
+
+class EmbeddingModelPool:
+    """
+    Keeps recently used embedding models loaded across runs.
+
+    Models are handed out with `get` and given back with `release`. A model
+    that is not in use is unloaded once it has been idle for longer than the
+    idle timeout, or earlier if the pool exceeds its memory budget.
+    """
+
+    def __init__(
+        self,
+        idle_timeout: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        logger.debug("Initializing EmbeddingModelPool")
+        self.idle_timeout = idle_timeout or get_env_float(
+            "EMBEDDING_MODEL_POOL_IDLE_SECONDS", DEFAULT_IDLE_TIMEOUT_SECONDS
+        )
+        self.max_bytes = max_bytes or int(
+            get_env_float("EMBEDDING_MODEL_POOL_MAX_BYTES", DEFAULT_MAX_POOL_BYTES)
+        )
+        self._models: Dict[str, _PooledModel] = {}
+        self._lock = threading.RLock()
+        self._idle_thread: Optional[threading.Thread] = None
+
+    def __contains__(self, model_name: str) -> bool:
+        return model_name in self._models
+
+    @property
+    def size(self) -> int:
+        """Number of bytes held by the parameters of all loaded models"""
+        return sum(entry.size for entry in self._models.values())
+
+    def get(self, model_name: str) -> SentenceTransformer:
+        """
+        Get a loaded model, loading it if it is not in the pool yet.
+        Every call has to be paired with a call to `release`.
+        """
+        with self._lock:
+            entry = self._models.get(model_name)
+            if entry is None:
+                start_time = time.time()
+                entry = _PooledModel(SentenceTransformer(model_name))
+                self._models[model_name] = entry
+                logger.info(
+                    f"Loaded embedding model {model_name} ({entry.size / 1024**2:.0f} MiB) in {time.time() - start_time:.2f}s"
+                )
+            else:
+                logger.info(f"Reusing loaded embedding model {model_name}")
+            entry.in_use += 1
+            entry.last_used = time.time()
+            self._evict_over_budget()
+            self._start_idle_thread()
+            return entry.model
+
+    def get_process_pool(self, model_name: str, workers: int) -> dict:
+        """
+        Get a pool of CPU worker processes that each hold a copy of a model
+        handed out by `get`. The pool is kept with the model and reused by
+        later runs with the same number of workers. The workers keep the
+        model's sequence length, `encode_texts` truncates the texts it sends.
+        """
+        with self._lock:
+            entry = self._models[model_name]
+            key = (workers,)
+            if entry.process_pool is not None and entry.process_pool_key == key:
+                return entry.process_pool
+            entry.stop_process_pool()
+
+            model = entry.model
+            # Split the cores between the workers instead of letting every
+            # worker start one intra-op thread per core
+            threads = str(max((os.cpu_count() or 1) // workers, 1))
+            previous_env = {
+                name: os.environ.get(name)
+                for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS")
+            }
+            os.environ.update({name: threads for name in previous_env})
+            start_time = time.time()
+            try:
+                entry.process_pool = model.start_multi_process_pool(
+                    target_devices=["cpu"] * workers
+                )
+                entry.process_pool_key = key
+            finally:
+                for name, value in previous_env.items():
+                    if value is None:
+                        os.environ.pop(name, None)
+                    else:
+                        os.environ[name] = value
+            logger.info(
+                f"Started {workers} embedding workers for {model_name} with {threads} threads each in {time.time() - start_time:.2f}s"
+            )
+            return entry.process_pool
+
+    def release(self, model_name: str):
+        """Mark a model that was handed out by `get` as no longer in use"""
+        with self._lock:
+            entry = self._models.get(model_name)
+            if entry is None:
+                return
+            entry.in_use = max(entry.in_use - 1, 0)
+            entry.last_used = time.time()
+            self._evict_over_budget()
+
+    def evict_idle(self):
+        """Unload all models that have been idle for longer than the timeout"""
+        with self._lock:
+            now = time.time()
+            for model_name, entry in list(self._models.items()):
+                if entry.in_use == 0 and now - entry.last_used > self.idle_timeout:
+                    logger.info(
+                        f"Unloading embedding model {model_name} after {now - entry.last_used:.0f}s idle"
+                    )
+                    self._unload(model_name)
+
+    def clear(self):
+        """Unload all models that are not in use"""
+        with self._lock:
+            for model_name, entry in list(self._models.items()):
+                if entry.in_use == 0:
+                    self._unload(model_name)
+
+    def _evict_over_budget(self):
+        # Unload the least recently used idle models first
+        idle_models = sorted(
+            (
+                (entry.last_used, model_name)
+                for model_name, entry in self._models.items()
+                if entry.in_use == 0
+            )
+        )
+        for _, model_name in idle_models:
+            if self.size <= self.max_bytes:
+                break
+            logger.info(
+                f"Unloading embedding model {model_name} to stay within the model pool budget"
+            )
+            self._unload(model_name)
+
+    def _unload(self, model_name: str):
+        entry = self._models.pop(model_name)
+        try:
+            entry.stop_process_pool()
+        except Exception as e:
+            logger.warning(f"Failed to stop embedding workers of {model_name}: {e}")
+        del entry
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _start_idle_thread(self):
+        if self._idle_thread is not None and self._idle_thread.is_alive():
+            return
+        self._idle_thread = threading.Thread(
+            target=self._idle_loop, name="embedding-model-pool", daemon=True
+        )
+        self._idle_thread.start()
+
+    def _idle_loop(self):
+        while True:
+            time.sleep(min(IDLE_CHECK_INTERVAL_SECONDS, self.idle_timeout))
+            try:
+                self.evict_idle()
+            except Exception as e:
+                logger.warning(f"Failed to unload idle embedding models: {e}")
+            with self._lock:
+                if not self._models:
+                    self._idle_thread = None
+                    return
@@ -41,6 +41,8 @@ ActionType = Literal[
     "get_cached_models",
     "get_available_models",
     "fetch_raw_responses",
+    "precompute_embeddings",
+    "get_cache_stats",
 ]
 StatusType = Literal["todo", "start", "complete", "error"]
 ClusteringStepType = Literal[
@@ -110,6 +112,14 @@ class ClusteringProgressMessage(BaseModel):
     timestamp: float = Field(default_factory=time.time)
 
 
+class EmbeddingProgressMessage(BaseModel):
+    step: StepType
+    completed: int
+    total: int
+    texts_per_second: float
+    timestamp: float = Field(default_factory=time.time)
+
+
 class CurrentRunMessage(BaseModel):
     run: "Run"
     timesteps: "Timesteps"
@@ -222,6 +232,25 @@ class RawResponsesMessage(BaseModel):
     responses: list[str]
 
 
+class CacheStatsMessage(BaseModel):
+    class ModelCacheStats(BaseModel):
+        model_name: str
+        entries: int
+        dim: Optional[int]
+        dtype: Optional[str]
+        hits: int
+        misses: int
+        bytes_read: int
+        bytes_written: int
+        load_seconds: float
+        evictions: int
+        hit_rate: float
+
+    models: list[ModelCacheStats]
+    memory_entries: int
+    memory_bytes: int
+
+
 MessageType = Literal[
     "progress",
     "file_path",
@@ -238,9 +267,12 @@ MessageType = Literal[
     "cached_models",
     "available_models",
     "raw_responses",
+    "embedding_progress",
+    "cache_stats",
 ]
 MessageDataType = Union[
     ProgressMessage,
+    EmbeddingProgressMessage,
     list["Run"],
     Error,
     CurrentRunMessage,
@@ -254,6 +286,7 @@ MessageDataType = Union[
     CachedModelsMessage,
     AvailableModelsMessage,
     RawResponsesMessage,
+    CacheStatsMessage,
     str,
     None,
 ]
@@ -284,6 +317,9 @@ class ManualClusterCount(CamelModel):
 class OutlierDetectionSettings(CamelModel):
     nearest_neighbors: int
     z_score_threshold: float
+    neighbor_search: Literal["exact", "approximate"] = "exact"
+    # Lists probed per query by the approximate search, more is slower but more accurate
+    nprobe: Optional[int] = Field(default=None, ge=1)
 
 
 class AgglomerativeClusteringSettings(CamelModel):
@@ -298,7 +334,24 @@ class KSelectionMetric(CamelModel):
 
 class AdvancedSettings(CamelModel):
     embedding_model: Optional[str] = None
-    kmeans_method: Literal["kmeans", "spherical_kmeans"] = "kmeans"
+    # Mini-batch spherical k-means trades some accuracy for speed on large inputs
+    kmeans_method: Literal[
+        "kmeans", "spherical_kmeans", "minibatch_spherical_kmeans"
+    ] = "kmeans"
+    embedding_batch_size: int = Field(default=32, ge=1)
+    embedding_max_seq_length: Optional[int] = Field(default=None, ge=1)
+    # Number of CPU worker processes that each hold a copy of the model
+    embedding_workers: int = Field(default=1, ge=1)
+    # Worker processes that fit and score the cluster counts of the k sweep
+    kselection_workers: int = Field(default=1, ge=1)
+    # Fit every cluster count from scratch, or from the previous count's centers
+    kselection_sweep: Literal["independent", "warm_start"] = "independent"
+    # Evaluate every cluster count, or search for the best one with fewer fits
+    kselection_search: Literal["exhaustive", "coarse_to_fine", "golden_section"] = (
+        "exhaustive"
+    )
+    # Overlap parsing, model loading and embedding instead of running them in turn
+    pipelined_embedding: bool = False
     kselection_metrics: list[KSelectionMetric] = Field(
         default=[
             KSelectionMetric(name="silhouette", weight=0.5),
@@ -530,6 +583,10 @@ class MergingStatistics(SQLModel, table=True):
 class Timesteps(SQLModel, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     steps: dict[ClusteringStepType, float] = Field(sa_column=Column(JSON))
+    # Embedding cache hits and misses of the run, see `CachedEmbedder.stats`
+    cache_stats: Optional[dict[str, float]] = Field(
+        default=None, sa_column=Column(JSON)
+    )
 
     @computed_field
     @property
@@ -552,7 +609,9 @@ class KSelectionStatistic(SQLModel, table=True):
     silhouette: Optional[float] = None
     davies_bouldin: Optional[float] = None
     calinski_harabasz: Optional[float] = None
-    combined: float
+    # None if the search skipped this k
+    combined: Optional[float] = None
+    evaluated: bool = True
 
     result_id: Optional[uuid.UUID] = Field(
         default=None, foreign_key="clusteringresult.id"
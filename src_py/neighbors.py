@@ -0,0 +1,253 @@
+from typing import Optional
+
+import numpy as np
+from loguru import logger
+
+from utils.utils import get_env_int
+
+# Memory for the similarity tiles, can be overridden through the environment
+DEFAULT_MAX_TILE_BYTES = 256 * 1024**2
+# Below this many embeddings an exact search is about as fast as building an index
+APPROXIMATE_SEARCH_MIN_SIZE = 10_000
+
+
+def get_tile_rows(
+    row_count: int, column_count: int, itemsize: int, max_bytes: Optional[int] = None
+) -> int:
+    """Number of rows per tile so that a tile and its partitioned copy fit the budget"""
+    if max_bytes is None:
+        max_bytes = get_env_int("NEIGHBOR_SEARCH_MAX_BYTES", DEFAULT_MAX_TILE_BYTES)
+    return int(
+        min(max(max_bytes // (2 * max(column_count, 1) * itemsize), 1), row_count)
+    )
+
+
+def exact_search(
+    queries: np.ndarray,
+    embeddings: np.ndarray,
+    count: int,
+    max_bytes: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Largest `count` similarities of every query to the embeddings, sorted
+    in descending order.
+
+    The similarity matrix is computed in tiles of queries against all
+    embeddings, and only the largest similarities of each row are kept, so
+    memory stays within `max_bytes` instead of growing with the number of
+    queries times the number of embeddings.
+    """
+    n = len(queries)
+    tile_rows = get_tile_rows(n, len(embeddings), embeddings.dtype.itemsize, max_bytes)
+    nearest = np.empty((n, max(count, 0)), dtype=embeddings.dtype)
+    for start in range(0, n, tile_rows):
+        end = min(start + tile_rows, n)
+        negative_similarities = np.dot(queries[start:end], embeddings.T)
+        np.negative(negative_similarities, out=negative_similarities)
+        tile_nearest = np.partition(negative_similarities, count - 1, axis=1)[
+            :, :count
+        ]
+        del negative_similarities
+        tile_nearest.sort(axis=1)
+        nearest[start:end] = -tile_nearest
+    return nearest
+
+
+def average_neighbor_similarity(
+    embeddings: np.ndarray, k: int, max_bytes: Optional[int] = None
+) -> np.ndarray:
+    """
+    Average similarity of every embedding to its k nearest neighbors.
+
+    The most similar entry of a row is the embedding itself and is skipped.
+
+    Args:
+        embeddings: Normalized embeddings, one per row
+        k: Number of neighbors to average over
+        max_bytes: Memory budget for one tile, defaults to the
+            NEIGHBOR_SEARCH_MAX_BYTES environment variable or 256 MiB
+    """
+    nearest = exact_search(embeddings, embeddings, k + 1, max_bytes)
+    return np.mean(nearest[:, 1 : k + 1], axis=1)
+
+
+def train_quantizer(
+    embeddings: np.ndarray,
+    n_lists: int,
+    rng: np.random.Generator,
+    max_iter: int = 10,
+) -> np.ndarray:
+    """
+    Spherical k-means centroids for an `IVFIndex`.
+
+    The centroids start at random embeddings and take a few Lloyd
+    iterations, which is enough for a coarse quantizer and avoids the
+    quadratic cost of k-means++ seeding with hundreds of lists.
+    """
+    n = len(embeddings)
+    centroids = embeddings[rng.choice(n, n_lists, replace=False)].copy()
+    for _ in range(max_iter):
+        labels = np.argmax(embeddings @ centroids.T, axis=1)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=n_lists)
+        filled = counts > 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        centroids[filled] = np.add.reduceat(
+            embeddings[order], starts[filled], axis=0
+        )
+        # Empty lists are reseeded with random embeddings
+        centroids[~filled] = embeddings[rng.choice(n, int((~filled).sum()))]
+        centroids /= np.maximum(
+            np.linalg.norm(centroids, axis=1, keepdims=True), np.finfo(np.float32).eps
+        )
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted file index for approximate nearest neighbor search over
+    normalized embeddings.
+
+    A spherical k-means coarse quantizer, trained on a sample, splits the embeddings into lists,
+    and a query is only compared with the embeddings of the `nprobe` lists
+    whose centroids are most similar to it. With about sqrt(n) lists a query
+    touches a small fraction of the embeddings, and raising `nprobe` trades
+    speed for recall up to an exact search at `nprobe == n_lists`.
+
+    The embeddings are stored grouped by list, so every list is scanned as
+    one contiguous block for all the queries that probe it.
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        n_lists: Optional[int] = None,
+        nprobe: Optional[int] = None,
+        random_state: Optional[int] = None,
+        training_points_per_list: int = 64,
+        max_bytes: Optional[int] = None,
+    ):
+        n = len(embeddings)
+        self.max_bytes = max_bytes
+        self.n_lists = int(min(max(n_lists or round(np.sqrt(n)), 1), max(n, 1)))
+        self.nprobe = int(
+            min(max(nprobe or round(np.sqrt(self.n_lists)), 1), self.n_lists)
+        )
+
+        # The quantizer is trained on a sample, every embedding is assigned
+        rng = np.random.default_rng(random_state)
+        training_size = self.n_lists * training_points_per_list
+        training_ids = (
+            np.sort(rng.choice(n, training_size, replace=False))
+            if n > training_size
+            else np.arange(n)
+        )
+        self.centroids = train_quantizer(embeddings[training_ids], self.n_lists, rng)
+        assignments = np.empty(n, dtype=np.int64)
+        for start in range(0, n, 8192):
+            assignments[start : start + 8192] = np.argmax(
+                embeddings[start : start + 8192] @ self.centroids.T, axis=1
+            )
+
+        order = np.argsort(assignments, kind="stable")
+        self.ids = order
+        self.vectors = np.ascontiguousarray(embeddings[order])
+        self.offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assignments, minlength=self.n_lists))]
+        )
+        logger.debug(
+            f"Built IVF index over {n} embeddings with {self.n_lists} lists (nprobe={self.nprobe})"
+        )
+
+    def _probe(self, queries: np.ndarray, nprobe: int) -> np.ndarray:
+        """Lists to search for every query"""
+        if nprobe >= self.n_lists:
+            return np.broadcast_to(np.arange(self.n_lists), (len(queries), self.n_lists))
+        probes = np.empty((len(queries), nprobe), dtype=np.int64)
+        for start in range(0, len(queries), 8192):
+            centroid_similarities = queries[start : start + 8192] @ self.centroids.T
+            probes[start : start + 8192] = np.argpartition(
+                -centroid_similarities, nprobe - 1, axis=1
+            )[:, :nprobe]
+        return probes
+
+    def search(
+        self, queries: np.ndarray, k: int, nprobe: Optional[int] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the approximate k nearest neighbors of every query.
+
+        Returns:
+            Similarities and ids of the neighbors in descending order of
+            similarity. Queries with fewer than k candidates in their probed
+            lists are padded with -inf and -1.
+        """
+        nprobe = int(min(max(nprobe or self.nprobe, 1), self.n_lists))
+        query_count = len(queries)
+        best_similarities = np.full((query_count, k), -np.inf, dtype=self.vectors.dtype)
+        best_ids = np.full((query_count, k), -1, dtype=np.int64)
+        if query_count == 0 or k <= 0:
+            return best_similarities, best_ids
+
+        # Invert the probes, so every list is scanned once for all its queries
+        probes = self._probe(queries, nprobe)
+        probed_lists = probes.ravel()
+        probing_queries = np.repeat(np.arange(query_count), probes.shape[1])
+        order = np.argsort(probed_lists, kind="stable")
+        bounds = np.searchsorted(probed_lists[order], np.arange(self.n_lists + 1))
+
+        for list_id in range(self.n_lists):
+            list_start, list_end = self.offsets[list_id], self.offsets[list_id + 1]
+            list_queries = probing_queries[order[bounds[list_id] : bounds[list_id + 1]]]
+            if list_end == list_start or len(list_queries) == 0:
+                continue
+            list_vectors = self.vectors[list_start:list_end]
+            list_ids = self.ids[list_start:list_end]
+            tile_rows = get_tile_rows(
+                len(list_queries),
+                list_end - list_start + k,
+                self.vectors.dtype.itemsize,
+                self.max_bytes,
+            )
+            for start in range(0, len(list_queries), tile_rows):
+                tile_queries = list_queries[start : start + tile_rows]
+                similarities = np.concatenate(
+                    [
+                        best_similarities[tile_queries],
+                        queries[tile_queries] @ list_vectors.T,
+                    ],
+                    axis=1,
+                )
+                ids = np.concatenate(
+                    [
+                        best_ids[tile_queries],
+                        np.broadcast_to(list_ids, (len(tile_queries), len(list_ids))),
+                    ],
+                    axis=1,
+                )
+                top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+                best_similarities[tile_queries] = np.take_along_axis(
+                    similarities, top, axis=1
+                )
+                best_ids[tile_queries] = np.take_along_axis(ids, top, axis=1)
+
+        order = np.argsort(-best_similarities, axis=1, kind="stable")
+        return (
+            np.take_along_axis(best_similarities, order, axis=1),
+            np.take_along_axis(best_ids, order, axis=1),
+        )
+
+
+def approximate_average_neighbor_similarity(
+    index: IVFIndex, embeddings: np.ndarray, k: int
+) -> np.ndarray:
+    """
+    Like `average_neighbor_similarity`, but with the neighbors found through
+    an index over the same embeddings. Embeddings whose probed lists hold
+    fewer than k + 1 candidates are searched exactly.
+    """
+    nearest, ids = index.search(embeddings, k + 1)
+    incomplete = ids[:, -1] < 0
+    if incomplete.any():
+        nearest[incomplete] = exact_search(embeddings[incomplete], embeddings, k + 1)
+    return np.mean(nearest[:, 1 : k + 1], axis=1)
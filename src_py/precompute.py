@@ -0,0 +1,143 @@
+import threading
+import time
+from typing import Optional
+
+from loguru import logger
+
+from app_cache import EmbeddingCache, MemoryEmbeddingCache
+from cached_embedding import CachedEmbedder
+from embedding import EmbeddingProgress, get_cache_key
+from ingestion import ParsedInputCache
+from model_pool import EmbeddingModelPool
+from models import AdvancedSettings, FileSettings
+from utils.ipc import print_progress
+
+# Texts are looked up and embedded in groups, cancellation is checked in between
+PRECOMPUTE_GROUP_SIZE = 512
+
+
+class EmbeddingPrecomputer:
+    """
+    Embeds the responses of the selected columns in a background thread.
+
+    Started once the file settings are known, so that the embeddings are
+    already cached when the user starts the clustering run. A new request
+    cancels the running one, and the run waits for a matching precompute to
+    finish instead of embedding the same texts again.
+    """
+
+    def __init__(
+        self,
+        embedding_cache: EmbeddingCache,
+        memory_cache: MemoryEmbeddingCache,
+        model_pool: EmbeddingModelPool,
+        parsed_input_cache: ParsedInputCache,
+    ):
+        self.embedding_cache = embedding_cache
+        self.memory_cache = memory_cache
+        self.model_pool = model_pool
+        self.parsed_input_cache = parsed_input_cache
+        self._thread: Optional[threading.Thread] = None
+        self._cancelled = threading.Event()
+        self._job: Optional[tuple] = None
+
+    def start(
+        self,
+        file_path: str,
+        file_settings: FileSettings,
+        model_name: str,
+        advanced_settings: AdvancedSettings,
+    ):
+        """Start precomputing, cancelling a precompute that is still running"""
+        self.cancel()
+        self._cancelled = threading.Event()
+        self._job = (
+            file_path,
+            file_settings,
+            get_cache_key(model_name, advanced_settings.embedding_max_seq_length),
+        )
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(
+                file_path,
+                file_settings,
+                model_name,
+                advanced_settings,
+                self._cancelled,
+            ),
+            name="embedding-precompute",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def cancel(self):
+        """Stop a running precompute and wait for its thread to exit"""
+        self._cancelled.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
+        self._job = None
+
+    def finish(self, file_path: str, file_settings: FileSettings, cache_key: str):
+        """
+        Wait for a precompute of the same file, settings and model to finish,
+        and cancel one that the coming run cannot use.
+        """
+        if self._thread is None:
+            return
+        if self._job != (file_path, file_settings, cache_key):
+            logger.info("Cancelling embedding precompute for other settings")
+            self.cancel()
+            return
+        logger.info("Waiting for embedding precompute to finish")
+        self._thread.join()
+        self._thread = None
+        self._job = None
+
+    def _run(
+        self,
+        file_path: str,
+        file_settings: FileSettings,
+        model_name: str,
+        advanced_settings: AdvancedSettings,
+        cancelled: threading.Event,
+    ):
+        print_progress("precompute_embeddings", "start")
+        embedder = CachedEmbedder(
+            self.embedding_cache,
+            self.memory_cache,
+            self.model_pool,
+            model_name,
+            advanced_settings,
+        )
+        start_time = time.time()
+        try:
+            texts = self.parsed_input_cache.get(file_path, file_settings).responses
+            embedding_model = self.model_pool.get(model_name)
+        except Exception as e:
+            print_progress("precompute_embeddings", "error")
+            logger.warning(f"Failed to prepare embedding precompute: {e}")
+            return
+
+        try:
+            # The total grows as uncached texts are discovered
+            progress = EmbeddingProgress("precompute_embeddings", 0)
+            for start in range(0, len(texts), PRECOMPUTE_GROUP_SIZE):
+                if cancelled.is_set():
+                    logger.info("Embedding precompute cancelled")
+                    return
+                embedder.get_embeddings(
+                    texts[start : start + PRECOMPUTE_GROUP_SIZE],
+                    embedding_model,
+                    progress,
+                )
+            logger.info(
+                f"Precomputed {progress.completed} embeddings for {len(texts)} responses in {time.time() - start_time:.2f}s"
+            )
+            print_progress("precompute_embeddings", "complete")
+        except Exception as e:
+            print_progress("precompute_embeddings", "error")
+            logger.warning(f"Failed to precompute embeddings: {e}")
+        finally:
+            self.model_pool.release(model_name)
+            self.embedding_cache.flush_stats()
@@ -7,17 +7,26 @@ from models import (
     MessageType,
     MessageDataType,
 )
+import threading
 import time
 from pprint import pprint
 
+# Messages are printed from worker threads too, a message must not be split up
+_print_lock = threading.Lock()
+
 
 def print_message(type: MessageType, data: MessageDataType, pretty: bool = False):
     logger.info(f"Printing message: {type} - {data}")
-    if pretty:
-        pprint(Message(type=type, data=data).model_dump())
-    else:
-        print(Message(type=type, data=data).model_dump_json(), flush=True, end="\n\n\n")
-    time.sleep(0.01)
+    with _print_lock:
+        if pretty:
+            pprint(Message(type=type, data=data).model_dump())
+        else:
+            print(
+                Message(type=type, data=data).model_dump_json(),
+                flush=True,
+                end="\n\n\n",
+            )
+        time.sleep(0.01)
 
 
 def print_progress(
@@ -28,6 +37,7 @@ def print_progress(
         type="progress",
         data=ProgressMessage(step=step, status=status, timestamp=time.time()),
     )
-    print(progress_message.model_dump_json(), flush=True, end="\n\n\n")
-    logger.info(progress_message.model_dump_json())
-    time.sleep(0.01)
+    with _print_lock:
+        print(progress_message.model_dump_json(), flush=True, end="\n\n\n")
+        logger.info(progress_message.model_dump_json())
+        time.sleep(0.01)
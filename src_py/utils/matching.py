@@ -0,0 +1,129 @@
+import re
+from typing import Optional
+
+
+def _build_trie_pattern(words: list[str]) -> Optional[str]:
+    """
+    Build a regular expression that matches any of the words.
+
+    The words are arranged in a trie first, so shared prefixes are only
+    tested once and the pattern behaves like a small automaton instead of a
+    flat alternation that retries every word at every position.
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: dict) -> Optional[str]:
+        branches = [
+            re.escape(char) + (build(child) or "")
+            for char, child in sorted(node.items())
+            if char != ""
+        ]
+        if not branches:
+            return None
+        pattern = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        if "" in node:
+            # A word ends here, the longer continuations are optional
+            pattern = f"(?:{pattern})?"
+        return pattern
+
+    return build(trie)
+
+
+class ExcludedWordsMatcher:
+    """
+    Compiled form of the `excluded_words` setting.
+
+    A response is excluded if it equals an excluded word or contains it
+    preceded or followed by a space. All words are checked in a single regex
+    search per response.
+    """
+
+    def __init__(self, excluded_words: list[str]):
+        self.excluded_words = list(excluded_words)
+        self._exact = set(self.excluded_words)
+        # The empty word matches any response that contains a space
+        self._matches_any_space = "" in self._exact
+        words = sorted({word for word in self.excluded_words if word})
+        pattern = _build_trie_pattern(words)
+        self._pattern = (
+            re.compile(f" {pattern}|{pattern} ") if pattern is not None else None
+        )
+
+    def __bool__(self) -> bool:
+        return bool(self.excluded_words)
+
+    def search(self, response: str) -> Optional[str]:
+        """Return the excluded word found in the response, or None"""
+        if response in self._exact:
+            return response
+        if self._matches_any_space and " " in response:
+            return ""
+        if self._pattern is None:
+            return None
+        match = self._pattern.search(response)
+        if match is None:
+            return None
+        return match.group().strip(" ")
+
+    def is_excluded(self, response: str) -> bool:
+        return self.search(response) is not None
+
+
+def _is_excluded_naive(response: str, excluded_words: list[str]) -> bool:
+    for excluded_word in excluded_words:
+        if (
+            response == excluded_word
+            or f" {excluded_word}" in response
+            or f"{excluded_word} " in response
+        ):
+            return True
+    return False
+
+
+if __name__ == "__main__":
+    # Benchmark: throughput of the compiled matcher against the per-word loop.
+    # Run from src_py with `python -m utils.matching`
+    import csv
+    import glob
+    import os
+    import random
+    import time
+
+    from utils.utils import preprocess_response
+
+    example_dir = os.path.join(os.path.dirname(__file__), "..", "..", "example_data")
+    responses = []
+    for path in glob.glob(os.path.join(example_dir, "*.csv")):
+        with open(path, encoding="utf-8") as f:
+            dialect = csv.Sniffer().sniff(f.readline(), delimiters=",;")
+            f.seek(0)
+            for row in csv.reader(f, dialect):
+                responses.extend(
+                    preprocess_response(cell) for cell in row if cell.strip()
+                )
+    vocabulary = sorted({word for response in responses for word in response.split()})
+
+    rng = random.Random(0)
+    print(f"{len(responses)} responses, {len(vocabulary)} distinct words")
+    print(f"{'words':>6} {'naive resp/s':>14} {'compiled resp/s':>16} {'speedup':>8}")
+    for size in [1, 10, 100, 500, 1000]:
+        excluded_words = rng.sample(vocabulary, size)
+        matcher = ExcludedWordsMatcher(excluded_words)
+
+        start = time.perf_counter()
+        naive = [_is_excluded_naive(r, excluded_words) for r in responses]
+        naive_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        compiled = [matcher.is_excluded(r) for r in responses]
+        compiled_time = time.perf_counter() - start
+
+        assert naive == compiled
+        print(
+            f"{size:>6} {len(responses) / naive_time:>14.0f} {len(responses) / compiled_time:>16.0f} {naive_time / compiled_time:>7.1f}x"
+        )
@@ -1,5 +1,8 @@
 import os
 import sys
+from typing import Optional
+
+from loguru import logger
 
 
 def is_production_environment():
@@ -20,6 +23,30 @@ def get_user_data_path():
         return os.getcwd()
 
 
+def get_env_int(name: str, default: Optional[int]) -> Optional[int]:
+    """Integer set in the environment variable, or the default if it is unset or invalid"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logger.warning(f"Ignoring invalid value for {name}: {value}")
+        return default
+
+
+def get_env_float(name: str, default: float) -> float:
+    """Number set in the environment variable, or the default if it is unset or invalid"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"Ignoring invalid value for {name}: {value}")
+        return default
+
+
 def preprocess_response(response: str):
     return response.strip().lower().replace("\n", " ")
 